@@ -61,8 +61,12 @@ def compress_csv_files(source_dir, dest_dir):
     else:
         logging.error("No CSV files found to compress")
 
-compress_csv_files("./csv", "./csv_backup")
+def main():
+    compress_csv_files("./csv", "./csv_backup")
 
-delete_files_by_extension("./csv", "csv")
-delete_files_in_directories(directory_paths)
-logging.info("Done!")
\ No newline at end of file
+    delete_files_by_extension("./csv", "csv")
+    delete_files_in_directories(directory_paths)
+    logging.info("Done!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import logging
+import os
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from multiprocessing.managers import BaseManager
+from dotenv import load_dotenv
+
+import main as sweeper
+import sep
+from hakotx.hoststate import PresenceHistory
+from hakotx.ports import save_open_ports
+from hakotx.ranges import load_host_range
+
+load_dotenv()
+
+# main.py configured logging at ERROR on import; this module logs at INFO
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+DEFAULT_PORT = 50505
+SHARD_COUNT = 64
+LEASE_TIMEOUT = 60
+HEARTBEAT_INTERVAL = 10
+
+def _authkey():
+    """The shared HAKOTX_CLUSTER_KEY; the manager unpickles what it receives, so there is no default."""
+    key = os.getenv("HAKOTX_CLUSTER_KEY")
+    if not key:
+        logging.error("HAKOTX_CLUSTER_KEY is not set, refusing to start")
+        sys.exit(1)
+    return key.encode()
+
+class Coordinator:
+    """Hands out CIDR shards to workers and collects their results.
+
+    A shard is leased to one worker at a time. Workers renew the lease with
+    heartbeats; a lease that is not renewed within LEASE_TIMEOUT seconds is
+    treated as a dead worker and the shard goes back to the pending queue.
+    """
+
+    def __init__(self, shards, lease_timeout=LEASE_TIMEOUT):
+        self.shards = shards
+        self.lease_timeout = lease_timeout
+        self.pending = deque(range(len(shards)))
+        self.leases = {}
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        for shard_id, (worker_id, deadline) in list(self.leases.items()):
+            if deadline < now:
+                logging.warning(f"Worker {worker_id} missed its deadline, re-assigning shard {shard_id}")
+                del self.leases[shard_id]
+                self.pending.appendleft(shard_id)
+
+    def lease(self, worker_id):
+        """Returns (shard_id, shard) to work on, (None, None) to wait, or None when everything is done."""
+        with self.lock:
+            self._expire_leases()
+            if len(self.results) == len(self.shards):
+                return None
+            if not self.pending:
+                return None, None
+            shard_id = self.pending.popleft()
+            self.leases[shard_id] = (worker_id, time.monotonic() + self.lease_timeout)
+            logging.info(f"Shard {shard_id} assigned to worker {worker_id}")
+            return shard_id, self.shards[shard_id]
+
+    def heartbeat(self, worker_id, shard_id):
+        """Extends the lease; returns False if the shard was taken away from this worker."""
+        with self.lock:
+            lease = self.leases.get(shard_id)
+            if lease is None or lease[0] != worker_id:
+                return False
+            self.leases[shard_id] = (worker_id, time.monotonic() + self.lease_timeout)
+            return True
+
+    def submit(self, worker_id, shard_id, alive_ips, dead_ips, fingerprints):
+        """Records the result of a shard. The first complete result for a shard wins.
+
+        alive_ips maps each alive IP to its open ports.
+        """
+        with self.lock:
+            self.leases.pop(shard_id, None)
+            if shard_id in self.results:
+                return False
+            if shard_id in self.pending:
+                self.pending.remove(shard_id)
+            self.results[shard_id] = (alive_ips, dead_ips, fingerprints)
+            logging.info(f"Shard {shard_id} completed by worker {worker_id} "
+                         f"({len(self.results)}/{len(self.shards)})")
+            return True
+
+    def progress(self):
+        with self.lock:
+            return len(self.results), len(self.shards)
+
+    def merged(self):
+        """Merges shard results in shard order."""
+        alive_ips = {}
+        dead_ips = []
+        ip_results = {ip_type: [] for ip_type in sep.IP_TYPES}
+        failed_ips = []
+        fingerprinted = False
+
+        with self.lock:
+            results = [self.results[shard_id] for shard_id in sorted(self.results)]
+
+        for shard_alive, shard_dead, fingerprints in results:
+            alive_ips.update(shard_alive)
+            dead_ips.extend(shard_dead)
+            if fingerprints is None:
+                continue
+            fingerprinted = True
+            for ip, ip_type in fingerprints:
+                if ip_type is None:
+                    failed_ips.append(ip)
+                else:
+                    ip_results[ip_type].append(ip)
+
+        return alive_ips, dead_ips, (ip_results, failed_ips) if fingerprinted else None
+
+class CoordinatorManager(BaseManager):
+    pass
+
+def run_coordinator(args):
+    host_range = load_host_range()
+    coordinator = Coordinator(host_range.split(args.shards), args.lease_timeout)
+    CoordinatorManager.register("coordinator", callable=lambda: coordinator)
+
+    manager = CoordinatorManager(address=(args.bind, args.port), authkey=_authkey())
+    server = manager.get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Coordinator listening on {args.bind}:{args.port} with {len(coordinator.shards)} shards")
+
+    while not sweeper.stop_script:
+        done, total = coordinator.progress()
+        if done == total:
+            break
+        time.sleep(1)
+
+    if sweeper.stop_script:
+        logging.info("Coordinator stopped before completion.")
+        return
+
+    alive_ips, dead_ips, fingerprints = coordinator.merged()
+    sweeper.ensure_files_exist()
+    sweeper.save_sweep_results(list(alive_ips), dead_ips)
+    save_open_ports(alive_ips, sweeper.SWEEP_PORTS)
+    sweeper.record_presence(PresenceHistory(host_range), alive_ips)
+    if fingerprints is not None:
+        sep.save_results(*fingerprints)
+    logging.info("All shards merged.")
+
+def _heartbeat(coordinator, worker_id, shard_id, finished):
+    while not finished.wait(HEARTBEAT_INTERVAL):
+        try:
+            if not coordinator.heartbeat(worker_id, shard_id):
+                logging.warning(f"Lease on shard {shard_id} was lost")
+                return
+        except (OSError, EOFError) as e:
+            logging.error(f"Heartbeat for shard {shard_id} failed: {e}")
+
+def run_worker(args):
+    CoordinatorManager.register("coordinator")
+    manager = CoordinatorManager(address=(args.host, args.port), authkey=_authkey())
+    manager.connect()
+    coordinator = manager.coordinator()
+
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    stages = set(args.stages.split(","))
+
+    while not sweeper.stop_script:
+        try:
+            lease = coordinator.lease(worker_id)
+        except (OSError, EOFError) as e:
+            logging.error(f"Lost connection to the coordinator: {e}")
+            break
+        if lease is None:
+            break
+        shard_id, shard = lease
+        if shard_id is None:
+            time.sleep(1)
+            continue
+
+        finished = threading.Event()
+        threading.Thread(target=_heartbeat, args=(coordinator, worker_id, shard_id, finished), daemon=True).start()
+        try:
+            alive_ips = {}
+            dead_ips = []
+
+            def on_result(ip, open_ports):
+                if open_ports:
+                    alive_ips[ip] = open_ports
+                else:
+                    dead_ips.append(ip)
+
+            asyncio.run(sweeper.sweep(shard, on_result, sweeper.effective_concurrency(args.concurrency)))
+            if sweeper.stop_script:
+                break
+
+            fingerprints = None
+            if "fingerprint" in stages:
+                fingerprints = [(ip, result[0] if result else None)
+                                for ip, result in sep.fingerprint_hosts(
+                                    [ip for ip, ports in alive_ips.items()
+                                     if sep.HTTP_PORT in ports or sep.HTTP_PORT not in sweeper.SWEEP_PORTS])]
+            coordinator.submit(worker_id, shard_id, alive_ips, dead_ips, fingerprints)
+        finally:
+            finished.set()
+
+    logging.info(f"Worker {worker_id} exiting.")
+
+def run_local(args):
+    """Runs a coordinator and `--workers` worker processes on this machine over localhost."""
+    command = [sys.executable, os.path.abspath(__file__)]
+    # Without a configured key, a fresh one for this run only, inherited by the children
+    os.environ.setdefault("HAKOTX_CLUSTER_KEY", secrets.token_hex(32))
+    workers = []
+    coordinator = subprocess.Popen(command + ["coordinator", "--bind", "127.0.0.1", "--port", str(args.port),
+                                              "--shards", str(args.shards)])
+    try:
+        time.sleep(1)
+        for index in range(args.workers):
+            workers.append(subprocess.Popen(command + ["worker", "--host", "127.0.0.1", "--port", str(args.port),
+                                                      "--stages", args.stages, "--worker-id", f"local-{index}",
+                                                      "--concurrency", str(args.concurrency)]))
+        coordinator.wait()
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.terminate()
+        if coordinator.poll() is None:
+            coordinator.terminate()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Spread the sweep and fingerprint stages across several hosts.")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+
+    coordinator = subparsers.add_parser("coordinator", help="hand out shards and merge results into ips/")
+    coordinator.add_argument("--bind", default="127.0.0.1",
+                             help="address to listen on (default: 127.0.0.1; use 0.0.0.0 for remote workers)")
+    coordinator.add_argument("--port", type=int, default=DEFAULT_PORT)
+    coordinator.add_argument("--shards", type=int, default=SHARD_COUNT)
+    coordinator.add_argument("--lease-timeout", type=int, default=LEASE_TIMEOUT)
+
+    worker = subparsers.add_parser("worker", help="sweep and fingerprint shards leased from a coordinator")
+    worker.add_argument("--host", required=True)
+    worker.add_argument("--port", type=int, default=DEFAULT_PORT)
+    worker.add_argument("--worker-id")
+
+    local = subparsers.add_parser("local", help="run a coordinator and workers as local processes")
+    local.add_argument("--workers", type=int, default=2)
+    local.add_argument("--port", type=int, default=DEFAULT_PORT)
+    local.add_argument("--shards", type=int, default=SHARD_COUNT)
+
+    for subparser in (worker, local):
+        subparser.add_argument("--stages", default="sweep,fingerprint",
+                               help="comma separated stages to run on each shard (default: sweep,fingerprint)")
+        subparser.add_argument("--concurrency", type=int, default=sweeper.MAX_CONCURRENCY)
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, sweeper.signal_handler)
+    args = parse_args()
+    {"coordinator": run_coordinator, "worker": run_worker, "local": run_local}[args.role](args)
@@ -0,0 +1,66 @@
+import argparse
+import importlib.util
+import logging
+import os
+
+from hakotx.collect import load_collect_settings, run_drivers
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Vendor collectors that define a DRIVER for hakotx.collect
+DRIVER_SCRIPTS = [
+    "scripts/realtek.py",
+    "scripts/uniway.py",
+    "scripts/spu_ge22wd.py",
+    "scripts/gpnf14c.py",
+    "scripts/pn_bh2_03_02.py",
+    "scripts/spu_ge120w+onu4fer1tvaswd.py",
+    "scripts/xpn_rh2_00-07.py",
+]
+
+def load_drivers(scripts=DRIVER_SCRIPTS):
+    """Imports each collector script and returns its DRIVER."""
+    drivers = []
+    for script in scripts:
+        name = os.path.splitext(os.path.basename(script))[0]
+        spec = importlib.util.spec_from_file_location(
+            f"collector_{name}", os.path.join(os.path.dirname(os.path.abspath(__file__)), script))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        drivers.append(module.DRIVER)
+    return drivers
+
+def main(types=None, concurrency=None, max_concurrency=None, full=False):
+    """Collects configurations for every model in one process, or only for the fingerprint `types` given.
+
+    `concurrency` and `max_concurrency` override [collect] in the config file.
+    With `full`, devices backing off after failures are tried as well.
+    """
+    settings = load_collect_settings()
+    settings = settings._replace(concurrency=concurrency or settings.concurrency,
+                                 max_concurrency=max_concurrency or settings.max_concurrency)
+    drivers = load_drivers()
+    if types:
+        drivers = [driver for driver in drivers if set(driver.types) & set(types)]
+    if not drivers:
+        logging.error("No collector handles the requested types")
+        return
+    logging.info(f"Collecting from {', '.join(driver.name for driver in drivers)}")
+    run_drivers(drivers, settings, full)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Collect device configurations for all models at once on a single event loop.")
+    parser.add_argument("types", nargs="*", help="fingerprint types to collect (default: all)")
+    parser.add_argument("--concurrency", type=int,
+                        help="devices collected at once per model at the start (default: [collect] concurrency)")
+    parser.add_argument("--max-concurrency", type=int,
+                        help="most devices the adaptive limit may reach per model; at or below --concurrency "
+                             "the pool is fixed (default: [collect] max_concurrency)")
+    parser.add_argument("--full", action="store_true",
+                        help="also try devices and subnets backing off after failures in earlier runs")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.types, args.concurrency, args.max_concurrency, args.full)
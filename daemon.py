@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import heapq
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import collect
+import main as sweeper
+import sep
+from hakotx.checkpoint import Checkpoint
+from hakotx.files import read_lines, write_atomic
+from hakotx.hoststore import FINGERPRINT_TTL, HostStore
+from hakotx.ports import OpenPorts, save_open_ports
+from hakotx.ranges import int_to_ip, ip_to_int, load_host_range
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DAEMON_STATE = "ips/.daemon_state.json"
+RESCAN_INTERVAL = 6 * 3600
+MIN_RESCAN_INTERVAL = 15 * 60
+BATCH_SUBNETS = 16
+COLLECT_INTERVAL = 3600
+
+# Vendor collector fed by each fingerprint type
+COLLECTORS = {
+    "realtek": "scripts/realtek.py",
+    "uniway": "scripts/uniway.py",
+    "SPU-GE22WD-H": "scripts/spu_ge22wd.py",
+    "SPU-GE120W-H": "scripts/spu_ge120w+onu4fer1tvaswd.py",
+    "ONU4FER1TVASWB": "scripts/spu_ge120w+onu4fer1tvaswd.py",
+    "PN_BH2_03-02": "scripts/pn_bh2_03_02.py",
+    "XPN_RH2_00-07": "scripts/xpn_rh2_00-07.py",
+    "AR9331": "scripts/ar9331.py",
+    "GPNF14C": "scripts/gpnf14c.py",
+}
+
+class Inventory:
+    """The warm fleet inventory: alive hosts with their open ports and fingerprint types.
+
+    It is loaded from the ips/*.txt files of the previous run and written back
+    with atomic replaces, so the files are never empty or half-written while a
+    refresh is in progress.
+    """
+
+    def __init__(self):
+        open_ports = OpenPorts()
+        self.alive = {ip: tuple(sorted(open_ports.ports.get(ip, ()))) for ip in read_lines("ips/alive.txt")}
+        self.types = {}
+        for ip_type in sep.IP_TYPES:
+            for ip in read_lines(f"ips/{ip_type}.txt"):
+                self.types[ip] = ip_type
+        self.failed = set(read_lines("ips/sep_failed.txt"))
+
+    def save(self):
+        alive_ips = sorted(self.alive, key=ip_to_int)
+        try:
+            write_atomic("ips/alive.txt", "\n".join(alive_ips))
+        except OSError as e:
+            logging.error(f"Failed to save alive IPs: {e}")
+        save_open_ports({ip: self.alive[ip] for ip in alive_ips}, sweeper.SWEEP_PORTS)
+
+        ip_results = {ip_type: [] for ip_type in sep.IP_TYPES}
+        for ip, ip_type in self.types.items():
+            ip_results[ip_type].append(ip)
+        sep.save_results(ip_results, list(self.failed))
+
+class Schedule:
+    """Rolling rescan schedule of the /24 subnets of the configured ranges.
+
+    Every subnet is rescanned at least every `interval` seconds. Subnets with
+    recent churn or fingerprint failures get a score that shortens their
+    interval, down to `min_interval`; the score decays by half per rescan.
+    """
+
+    def __init__(self, blocks, state, interval, min_interval):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.scores = {int(block): score for block, score in state.get("scores", {}).items()}
+        due = {int(block): when for block, when in state.get("due", {}).items()}
+        self.heap = [(due.get(block, 0.0), block) for block in blocks]
+        heapq.heapify(self.heap)
+
+    def pop_due(self, now, limit):
+        """Removes and returns up to `limit` subnets whose rescan is due, most overdue first."""
+        blocks = []
+        while self.heap and self.heap[0][0] <= now and len(blocks) < limit:
+            blocks.append(heapq.heappop(self.heap)[1])
+        return blocks
+
+    def next_due(self):
+        return self.heap[0][0] if self.heap else None
+
+    def reschedule(self, block, now, churn, failures):
+        score = self.scores.get(block, 0.0) / 2 + churn + failures
+        self.scores[block] = score
+        interval = max(self.min_interval, self.interval / (1 + score))
+        heapq.heappush(self.heap, (now + interval, block))
+
+    def state(self):
+        return {
+            "due": {str(block): when for when, block in self.heap},
+            "scores": {str(block): score for block, score in self.scores.items() if score >= 0.01},
+        }
+
+def rescan(host_range, blocks, inventory, store, ttl=FINGERPRINT_TTL, concurrency=sweeper.MAX_CONCURRENCY):
+    """Sweeps the given subnets, updates the inventory and returns churn and failures per subnet.
+
+    Alive hosts are fingerprinted again unless `store` (a HostStore) vouches
+    for their type: checked within `ttl` seconds with the same open ports.
+    """
+    addresses = [int_to_ip(value) for block in blocks for value in host_range.block_addresses(block)]
+    results = {}
+    asyncio.run(sweeper.sweep(addresses, lambda ip, open_ports: results.__setitem__(ip, open_ports),
+                              sweeper.effective_concurrency(concurrency)))
+
+    churn = {block: 0 for block in blocks}
+    failures = {block: 0 for block in blocks}
+    to_fingerprint = []
+    changed_types = set()
+
+    def classify(ip, ip_type):
+        inventory.failed.discard(ip)
+        if inventory.types.get(ip) != ip_type:
+            changed_types.add(ip_type)
+            inventory.types[ip] = ip_type
+
+    for ip, open_ports in results.items():
+        block = ip_to_int(ip) >> 8
+        previous = inventory.alive.get(ip)
+        if open_ports:
+            open_ports = tuple(sorted(open_ports))
+            if previous != open_ports:
+                churn[block] += 1
+                inventory.alive[ip] = open_ports
+            if sep.HTTP_PORT in open_ports or sep.HTTP_PORT not in sweeper.SWEEP_PORTS:
+                ip_type = store.cached(ip, HostStore.probe_of(open_ports), ttl)
+                if ip_type is None:
+                    to_fingerprint.append(ip)
+                else:
+                    classify(ip, ip_type)
+        elif previous is not None and not sweeper.stopping():
+            churn[block] += 1
+            del inventory.alive[ip]
+            inventory.types.pop(ip, None)
+            inventory.failed.discard(ip)
+    store.touch({ip: open_ports for ip, open_ports in results.items() if open_ports})
+
+    for ip, result in sep.fingerprint_hosts(to_fingerprint, store, inventory.alive):
+        if result is None:
+            # A host is listed under its type or as failed, never both
+            failures[ip_to_int(ip) >> 8] += 1
+            inventory.types.pop(ip, None)
+            inventory.failed.add(ip)
+        else:
+            classify(ip, result.type)
+    store.commit()
+
+    return churn, failures, changed_types
+
+def run_collectors(types):
+    # Models with a driver are collected together by collect.py, the rest by their own script
+    driven = sorted(ip_type for ip_type in types if COLLECTORS.get(ip_type) in collect.DRIVER_SCRIPTS)
+    if driven:
+        logging.info(f"Refreshing configurations for {', '.join(driven)} with collect.py")
+        try:
+            subprocess.run([sys.executable, "collect.py", *driven], check=True)
+        except subprocess.CalledProcessError as e:
+            logging.error(f"Collector collect.py failed: {e}")
+
+    scripts = {COLLECTORS[ip_type] for ip_type in types if ip_type in COLLECTORS}
+    for script in sorted(scripts - set(collect.DRIVER_SCRIPTS)):
+        logging.info(f"Refreshing configurations with {script}")
+        try:
+            subprocess.run([sys.executable, script], check=True)
+        except subprocess.CalledProcessError as e:
+            logging.error(f"Collector {script} failed: {e}")
+
+def run(args):
+    host_range = load_host_range()
+    os.makedirs("ips", exist_ok=True)
+    inventory = Inventory()
+    checkpoint = Checkpoint(DAEMON_STATE, host_range.key())
+    checkpoint.load()
+    schedule = Schedule(host_range.blocks(), checkpoint.state, args.interval, args.min_interval)
+    store = HostStore()
+
+    pending_collect = set()
+    last_collect = 0.0
+    logging.info(f"Daemon started with {len(inventory.alive)} hosts in the inventory")
+
+    while not sweeper.stop_script:
+        now = time.time()
+        blocks = schedule.pop_due(now, args.batch)
+        if blocks:
+            churn, failures, changed_types = rescan(host_range, blocks, inventory, store, args.ttl * 3600,
+                                                    args.concurrency)
+            if sweeper.stop_script:
+                # Unfinished subnets stay due and are picked up first after a restart
+                for block in blocks:
+                    schedule.reschedule(block, 0.0, churn[block], failures[block])
+                break
+            for block in blocks:
+                schedule.reschedule(block, time.time(), churn[block], failures[block])
+            inventory.save()
+            checkpoint.state = schedule.state()
+            checkpoint.save()
+            pending_collect |= changed_types
+            logging.info(f"Rescanned {len(blocks)} subnets, {sum(churn.values())} changed hosts, "
+                         f"{sum(failures.values())} fingerprint failures")
+
+        if args.collect and pending_collect and time.time() - last_collect >= args.collect_interval:
+            run_collectors(pending_collect)
+            pending_collect.clear()
+            last_collect = time.time()
+
+        if not blocks:
+            next_due = schedule.next_due()
+            time.sleep(max(1.0, min(30.0, (next_due or now + 30) - time.time())))
+
+    checkpoint.state = schedule.state()
+    checkpoint.save()
+    store.close()
+    logging.info("Daemon stopped.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Keep the fleet inventory warm with rolling rescans.")
+    parser.add_argument("--interval", type=int, default=RESCAN_INTERVAL,
+                        help=f"longest time between rescans of a subnet in seconds (default: {RESCAN_INTERVAL})")
+    parser.add_argument("--min-interval", type=int, default=MIN_RESCAN_INTERVAL,
+                        help=f"shortest time between rescans of a busy subnet (default: {MIN_RESCAN_INTERVAL})")
+    parser.add_argument("--batch", type=int, default=BATCH_SUBNETS,
+                        help=f"subnets rescanned per round (default: {BATCH_SUBNETS})")
+    parser.add_argument("--concurrency", type=int, default=sweeper.MAX_CONCURRENCY,
+                        help=f"connects kept in flight by the sweep (default: {sweeper.MAX_CONCURRENCY})")
+    parser.add_argument("--ttl", type=float, default=FINGERPRINT_TTL / 3600,
+                        help=f"hours a stored classification stays valid (default: {FINGERPRINT_TTL // 3600})")
+    parser.add_argument("--collect", action="store_true",
+                        help="run the vendor collectors for types whose host list changed")
+    parser.add_argument("--collect-interval", type=int, default=COLLECT_INTERVAL,
+                        help=f"minimum seconds between collector runs (default: {COLLECT_INTERVAL})")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, sweeper.signal_handler)
+    signal.signal(signal.SIGTERM, sweeper.signal_handler)
+    run(parse_args())
@@ -0,0 +1 @@
+"""Shared building blocks for the HakotX sweep, fingerprint and collector stages."""
@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import time
+
+from hakotx.files import write_atomic
+from hakotx.ranges import int_to_ip, ip_to_int
+
+CHECKPOINT_INTERVAL = 30
+
+def ips_to_intervals(ips):
+    """Compresses dotted-quad IPs into sorted [first, last] integer runs."""
+    intervals = []
+    for value in sorted(ip_to_int(ip) for ip in ips):
+        if intervals and value <= intervals[-1][1] + 1:
+            intervals[-1][1] = max(intervals[-1][1], value)
+        else:
+            intervals.append([value, value])
+    return intervals
+
+def intervals_to_ips(intervals):
+    return [int_to_ip(value) for lo, hi in intervals for value in range(lo, hi + 1)]
+
+class Checkpoint:
+    """Periodically persisted progress of a long-running stage.
+
+    `state` is a JSON-serializable dict owned by the stage. The file is only
+    trusted on load when it was written for the same `key` (e.g. the swept
+    ranges), and it is replaced atomically so an interrupted write never
+    leaves a torn checkpoint behind.
+    """
+
+    def __init__(self, path, key, interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.key = key
+        self.interval = interval
+        self.state = {}
+        self._last_save = time.monotonic()
+
+    def load(self):
+        """Loads the saved state; returns False if there is none or it belongs to another key."""
+        try:
+            with open(self.path, "r") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return False
+
+        if data.get("key") != self.key:
+            logging.warning(f"Checkpoint {self.path} was written for a different configuration, ignoring it")
+            return False
+        self.state = data.get("state", {})
+        return True
+
+    def save(self):
+        try:
+            write_atomic(self.path, json.dumps({"key": self.key, "saved": time.time(), "state": self.state}))
+            logging.info(f"Checkpoint saved to {self.path}")
+        except OSError as e:
+            logging.error(f"Failed to save checkpoint {self.path}: {e}")
+        self._last_save = time.monotonic()
+
+    def maybe_save(self, build_state):
+        """Saves build_state() if the checkpoint interval has elapsed; returns whether it did."""
+        if time.monotonic() - self._last_save >= self.interval:
+            self.state = build_state()
+            self.save()
+            return True
+        return False
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import configparser
+import logging
+import os
+import time
+from collections import namedtuple
+
+from hakotx.concurrency import AIMDController
+from hakotx.hoststore import HostStore
+from hakotx.ledger import FailureLedger
+from hakotx.politeness import PolitenessLimiter, load_politeness
+from hakotx.ranges import CONFIG_FILE
+from hakotx.rawhttp import FetchError, HTTPSession
+
+# Devices collected at once per model: the starting limit, None for the
+# driver's own, and the most the adaptive limit may grow to, None for four
+# times the start. A start at or above the maximum makes a fixed pool of the
+# maximum, which timeouts do not shrink either.
+CollectSettings = namedtuple("CollectSettings", ["concurrency", "max_concurrency"])
+
+def load_collect_settings(config_file=CONFIG_FILE):
+    """Reads the parallelism of the collectors from [collect] concurrency and max_concurrency."""
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    return CollectSettings(
+        concurrency=config.getint('collect', 'concurrency', fallback=None),
+        max_concurrency=config.getint('collect', 'max_concurrency', fallback=None),
+    )
+
+class Driver:
+    """How configurations are collected from one family of devices.
+
+    A driver names the ips/<type>.txt lists it serves and the folder its
+    configurations are saved to, and implements the per-device steps on an
+    HTTPSession of that device: login() returns whatever fetch() needs from
+    it (a CSRF token, say, or None) and fetch() returns the configuration.
+    extract() runs once after all devices, over the saved files.
+    """
+
+    name = None
+    types = ()
+    folder = None
+    extension = ".xml"
+    # Devices of this driver collected at once, adjusted by an AIMDController
+    concurrency = 10
+    headers = {}
+    connect_timeout = 4
+    timeout = 10
+
+    def hosts(self):
+        """The IPs of every type the driver serves, in file order and without duplicates."""
+        ips = []
+        for ip_type in self.types:
+            path = f"./ips/{ip_type}.txt"
+            try:
+                with open(path, "r") as file:
+                    ips.extend(line.strip() for line in file if line.strip())
+            except FileNotFoundError:
+                logging.warning(f"{path} not found")
+        return list(dict.fromkeys(ips))
+
+    async def login(self, session, ip):
+        return None
+
+    async def fetch(self, session, ip, token):
+        raise NotImplementedError
+
+    def save(self, ip, content):
+        path = os.path.join(self.folder, f"{ip}{self.extension}")
+        with open(path, "wb") as file:
+            file.write(content)
+        logging.info(f"Downloaded file saved: {path}")
+
+    def extract(self, collected):
+        """Writes the driver's CSV from the saved configurations; `collected` are the IPs saved in this run."""
+
+async def _collect_device(driver, ip, controller, limiter):
+    async with limiter.slot(ip):
+        session = HTTPSession(driver.headers, driver.connect_timeout, driver.timeout, pace=limiter.pace)
+        started = time.monotonic()
+        step = "login"
+        try:
+            token = await driver.login(session, ip)
+            step = "config download"
+            content = await driver.fetch(session, ip, token)
+        except FetchError as e:
+            # HTTP errors and rejected logins say nothing about load; timeouts and connection errors do
+            if e.transport:
+                controller.record(False)
+            raise FetchError(f"{step} failed: {e}") from e
+        finally:
+            session.close()
+    controller.record(True, time.monotonic() - started)
+    driver.save(ip, content)
+
+async def collect(driver, settings=CollectSettings(None, None), limiter=None, stopping=lambda: False, ledger=None):
+    """Collects from the driver's hosts, keeping an AIMD-controlled number of devices in flight.
+
+    Every device gets its own HTTPSession, started only once `limiter` (a
+    PolitenessLimiter) has a slot for the device and its subnet, so the
+    limit counts devices being talked to. Hosts the
+    `ledger` (a FailureLedger) holds back are not contacted, and every outcome
+    is recorded in it. Returns the list of IPs collected and a dict of the
+    failed ones to what failed.
+    """
+    os.makedirs(driver.folder, exist_ok=True)
+    limiter = limiter or PolitenessLimiter(*load_politeness())
+    initial = settings.concurrency or driver.concurrency
+    minimum = 1
+    if settings.max_concurrency is not None and initial >= settings.max_concurrency:
+        minimum = settings.max_concurrency
+    controller = AIMDController(initial, minimum=minimum, maximum=settings.max_concurrency)
+    collected = []
+    failed = {}
+    in_flight = {}
+
+    def drain(done):
+        for task in done:
+            ip = in_flight.pop(task)
+            ok = False
+            try:
+                task.result()
+                collected.append(ip)
+                ok = True
+            except FetchError as e:
+                logging.error(f"Failed to collect from {ip}: {e}")
+                failed[ip] = str(e)
+                # Out of local resources: the device was never reached
+                if e.local:
+                    ok = None
+            except Exception as e:
+                logging.error(f"Error processing {ip}: {e}")
+                failed[ip] = str(e)
+            if ledger is not None and ok is not None:
+                ledger.record(ip, ok)
+
+    admitted = (ip for ip in driver.hosts() if ledger is None or ledger.admit(ip))
+    async for ip in limiter.fair(admitted):
+        if stopping():
+            break
+        while len(in_flight) >= controller.limit:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            drain(done)
+        in_flight[asyncio.ensure_future(_collect_device(driver, ip, controller, limiter))] = ip
+
+    if in_flight:
+        done, _ = await asyncio.wait(in_flight)
+        drain(done)
+    return collected, failed
+
+def report_failures(driver, failed):
+    if failed:
+        logging.info(f"Failed operations for {driver.name}:")
+        for ip, reason in failed.items():
+            logging.info(f"- {ip} ({reason})")
+    else:
+        logging.info(f"All {driver.name} operations successful")
+
+def run_drivers(drivers, settings=None, full=False):
+    """Collects from the devices of all drivers on one event loop, then runs each driver's extract().
+
+    `settings` default to those in the config file. The drivers share one
+    PolitenessLimiter, so the caps on a subnet hold across models. Each driver
+    keeps its own failures ledger in ips/hosts.db, so a device that fails one
+    model's login is not held back from another's; with `full` every device
+    is tried, backing off or not, e.g. after fixing credentials.
+    """
+    settings = settings or load_collect_settings()
+    os.makedirs("ips", exist_ok=True)
+    store = HostStore()
+    ledgers = [FailureLedger(store, f"collect:{driver.name}", enforce=not full) for driver in drivers]
+
+    async def collect_all():
+        limiter = PolitenessLimiter(*load_politeness())
+        return await asyncio.gather(*(collect(driver, settings, limiter, ledger=ledger)
+                                      for driver, ledger in zip(drivers, ledgers)))
+
+    try:
+        results = asyncio.run(collect_all())
+        for ledger in ledgers:
+            ledger.finish()
+    finally:
+        store.close()
+    for driver, ledger, (collected, failed) in zip(drivers, ledgers, results):
+        logging.info(f"{driver.name}: {len(collected)} configurations collected, {len(failed)} failed, "
+                     f"{ledger.skipped} skipped after earlier failures")
+        report_failures(driver, failed)
+        try:
+            driver.extract(collected)
+        except Exception as e:
+            logging.error(f"Extracting {driver.name} configurations failed: {e}")
+    return results
+
+def script_args(driver):
+    """Parses the command line of a standalone collector script."""
+    parser = argparse.ArgumentParser(description=f"Collect {driver.name} configurations.")
+    parser.add_argument("--full", action="store_true",
+                        help="also try devices and subnets backing off after failures in earlier runs")
+    return parser.parse_args()
@@ -0,0 +1,100 @@
+import threading
+import time
+
+class AIMDController:
+    """Concurrency limit driven by additive increase, multiplicative decrease.
+
+    Every healthy completion grows the limit by `increase / limit`, i.e. by
+    about `increase` per full round of operations. A failure, or a success
+    whose latency exceeds `latency_factor` times the moving average latency
+    (unless latency_factor is None), multiplies the limit by `decrease`. Decreases are spaced at least
+    `cooldown` seconds apart so a burst of failures from one congested round
+    only backs off once.
+
+    The limit can be read directly (the asyncio sweep does this), or used as
+    a gate by threads through acquire()/release() or call().
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, increase=1.0, decrease=0.5,
+                 latency_factor=4.0, cooldown=1.0, congestion_errors=(ConnectionError, TimeoutError)):
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial * 4
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.congestion_errors = congestion_errors
+        self._limit = float(min(self.maximum, max(minimum, initial)))
+        self._in_flight = 0
+        self._avg_latency = None
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def cap(self, maximum):
+        """Lowers the maximum, and the limit along with it, e.g. to fit a resource budget."""
+        with self._condition:
+            self.maximum = min(self.maximum, maximum)
+            self.minimum = min(self.minimum, self.maximum)
+            self._limit = min(self._limit, self.maximum)
+
+    def record(self, ok, latency=None):
+        """Feeds one outcome: True for success, False for congestion, None for no signal."""
+        with self._condition:
+            if ok and latency is not None and self.latency_factor:
+                if self._avg_latency is None:
+                    self._avg_latency = latency
+                elif latency > self._avg_latency * self.latency_factor:
+                    ok = False
+                self._avg_latency = self._avg_latency * 0.9 + latency * 0.1
+
+            if ok is False:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self._limit = max(self.minimum, self._limit * self.decrease)
+            elif ok:
+                self._limit = min(self.maximum, self._limit + self.increase / self._limit)
+            self._condition.notify_all()
+
+    def acquire(self):
+        """Blocks until fewer than `limit` operations are in flight."""
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, ok, latency=None):
+        with self._condition:
+            self._in_flight -= 1
+        self.record(ok, latency)
+
+    def call(self, func, *args, is_failure=None, **kwargs):
+        """Runs func(*args, **kwargs) in a slot and records its outcome.
+
+        Exceptions listed in `congestion_errors` and results for which
+        `is_failure(result)` is true count as failures; other exceptions are
+        re-raised without a signal.
+        """
+        self.acquire()
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except self.congestion_errors:
+            self.release(False)
+            raise
+        except BaseException:
+            self.release(None)
+            raise
+        if is_failure is not None and is_failure(result):
+            self.release(False)
+        else:
+            self.release(True, time.monotonic() - started)
+        return result
@@ -0,0 +1,39 @@
+import configparser
+from collections import namedtuple
+
+from hakotx.ranges import CONFIG_FILE, ip_to_int
+
+DensityPlan = namedtuple("DensityPlan", ["sample_size", "skip_sparse", "known_blocks"])
+
+def sample_block(addresses, size):
+    """Picks `size` addresses spread evenly across a /24, always including the first and last.
+
+    Network and broadcast style addresses (.0 and .255) are never sampled unless nothing else is left.
+    """
+    addresses = [value for value in addresses if value & 0xFF not in (0, 255)] or addresses
+    if len(addresses) <= size:
+        return list(addresses)
+    step = (len(addresses) - 1) / (size - 1) if size > 1 else 0
+    return sorted({addresses[round(index * step)] for index in range(size)})
+
+def blocks_of(ips):
+    """Returns the /24 blocks the given dotted-quad IPs live in."""
+    blocks = set()
+    for ip in ips:
+        ip = ip.strip()
+        if ip:
+            blocks.add(ip_to_int(ip) >> 8)
+    return blocks
+
+def load_density_plan(known_ips=(), config_file=CONFIG_FILE):
+    """Reads the density options from [sweep]; returns None when the sweep order is linear."""
+    config = configparser.ConfigParser()
+    config.read(config_file)
+
+    if config.get('sweep', 'order', fallback='linear') != 'density':
+        return None
+    return DensityPlan(
+        sample_size=config.getint('sweep', 'sample_size', fallback=8),
+        skip_sparse=config.get('sweep', 'sparse', fallback='defer') == 'skip',
+        known_blocks=frozenset(blocks_of(known_ips)),
+    )
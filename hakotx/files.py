@@ -0,0 +1,16 @@
+import os
+
+def read_lines(path):
+    """The non-empty lines of `path`, stripped; an empty list if the file does not exist."""
+    try:
+        with open(path, "r") as file:
+            return [line.strip() for line in file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def write_atomic(path, text):
+    """Replaces `path` with `text` in one step, so readers never see a missing or half-written file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,223 @@
+import base64
+import bisect
+import json
+import logging
+import time
+import zlib
+
+from hakotx.files import write_atomic
+from hakotx.ranges import int_to_ip, ip_to_int
+
+HISTORY_FILE = "ips/history.json"
+
+class HostBitmap:
+    """One bit per address of a HostRange, set for hosts that were alive.
+
+    Bits are kept in a bytearray for cheap updates; set operations go through
+    Python ints, so new/vanished/churn over a /16 are single C-level
+    operations instead of set arithmetic on tens of thousands of strings.
+    """
+
+    def __init__(self, host_range, data=None):
+        self.intervals = host_range.intervals
+        self._starts = [lo for lo, _ in self.intervals]
+        self._offsets = []
+        size = 0
+        for lo, hi in self.intervals:
+            self._offsets.append(size)
+            size += hi - lo + 1
+        self.size = size
+        self.host_range = host_range
+        self.bits = bytearray(data) if data is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def from_ips(cls, host_range, ips):
+        bitmap = cls(host_range)
+        for ip in ips:
+            bitmap.add(ip)
+        return bitmap
+
+    def _position(self, ip):
+        value = ip_to_int(ip)
+        index = bisect.bisect_right(self._starts, value) - 1
+        if index < 0 or value > self.intervals[index][1]:
+            return None
+        return self._offsets[index] + value - self._starts[index]
+
+    def _address(self, position):
+        index = bisect.bisect_right(self._offsets, position) - 1
+        return int_to_ip(self._starts[index] + position - self._offsets[index])
+
+    def add(self, ip):
+        position = self._position(ip)
+        if position is None:
+            return False
+        self.bits[position >> 3] |= 1 << (position & 7)
+        return True
+
+    def __contains__(self, ip):
+        position = self._position(ip)
+        return position is not None and bool(self.bits[position >> 3] & (1 << (position & 7)))
+
+    def positions(self):
+        """Yields the positions of the set bits in address order."""
+        for byte_index, byte in enumerate(self.bits):
+            if byte:
+                base = byte_index << 3
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield base + bit
+
+    def __iter__(self):
+        for position in self.positions():
+            yield self._address(position)
+
+    def __len__(self):
+        return self.as_int().bit_count()
+
+    def as_int(self):
+        return int.from_bytes(self.bits, "little")
+
+    def _from_int(self, value):
+        return HostBitmap(self.host_range, value.to_bytes(len(self.bits), "little"))
+
+    def __and__(self, other):
+        return self._from_int(self.as_int() & other.as_int())
+
+    def __or__(self, other):
+        return self._from_int(self.as_int() | other.as_int())
+
+    def __xor__(self, other):
+        return self._from_int(self.as_int() ^ other.as_int())
+
+    def __sub__(self, other):
+        return self._from_int(self.as_int() & ~other.as_int())
+
+    def new_since(self, previous):
+        """Hosts alive now that were not alive in `previous`."""
+        return self - previous
+
+    def vanished_since(self, previous):
+        """Hosts alive in `previous` that are gone now."""
+        return previous - self
+
+    def churn(self, previous):
+        """Hosts whose state changed either way."""
+        return self ^ previous
+
+    def encode(self):
+        """Run-length encodes the bitmap as alternating 0/1 run lengths (varints), zlib-compressed."""
+        out = bytearray()
+        cursor = 0
+        run_start = None
+        previous = None
+
+        def varint(value):
+            while True:
+                byte = value & 0x7F
+                value >>= 7
+                if value:
+                    out.append(byte | 0x80)
+                else:
+                    out.append(byte)
+                    return
+
+        for position in self.positions():
+            if previous is not None and position == previous + 1:
+                previous = position
+                continue
+            if run_start is not None:
+                varint(run_start - cursor)
+                varint(previous - run_start + 1)
+                cursor = previous + 1
+            run_start = previous = position
+        if run_start is not None:
+            varint(run_start - cursor)
+            varint(previous - run_start + 1)
+        return base64.b64encode(zlib.compress(bytes(out), 9)).decode()
+
+    @classmethod
+    def decode(cls, host_range, encoded):
+        bitmap = cls(host_range)
+        data = zlib.decompress(base64.b64decode(encoded))
+        values = []
+        value = shift = 0
+        for byte in data:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                values.append(value)
+                value = shift = 0
+
+        position = 0
+        for index in range(0, len(values) - 1, 2):
+            position += values[index]
+            for bit in range(position, position + values[index + 1]):
+                bitmap.bits[bit >> 3] |= 1 << (bit & 7)
+            position += values[index + 1]
+        return bitmap
+
+class PresenceHistory:
+    """Per-run presence bitmaps of a HostRange, stored as RLE deltas between runs.
+
+    Each run is kept as the run-length encoding of its XOR with the previous
+    run, so a quiet night costs a few bytes. The history is reset when the
+    configured ranges change.
+    """
+
+    def __init__(self, host_range, path=HISTORY_FILE, max_runs=365):
+        self.host_range = host_range
+        self.path = path
+        self.max_runs = max_runs
+        self.runs = []
+        self._bitmaps = None
+        try:
+            with open(path, "r") as file:
+                data = json.load(file)
+            if data.get("key") == host_range.key():
+                self.runs = data.get("runs", [])
+            else:
+                logging.warning("Configured ranges changed, starting a new presence history")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable presence history {path}: {e}")
+
+    def bitmaps(self):
+        """Returns (time, HostBitmap) for every recorded run, oldest first."""
+        if self._bitmaps is None:
+            self._bitmaps = []
+            current = HostBitmap(self.host_range)
+            for run in self.runs:
+                current = current ^ HostBitmap.decode(self.host_range, run["delta"])
+                self._bitmaps.append((run["time"], current))
+        return self._bitmaps
+
+    def latest(self):
+        bitmaps = self.bitmaps()
+        return bitmaps[-1][1] if bitmaps else None
+
+    def recent_union(self, runs):
+        """Hosts that were alive in any of the last `runs` runs."""
+        union = HostBitmap(self.host_range)
+        for _, bitmap in self.bitmaps()[-runs:]:
+            union = union | bitmap
+        return union
+
+    def append(self, bitmap, when=None):
+        when = when or time.time()
+        previous = self.latest() or HostBitmap(self.host_range)
+        self.bitmaps().append((when, bitmap))
+        self.runs.append({"time": when, "delta": (bitmap ^ previous).encode()})
+
+        if len(self.runs) > self.max_runs:
+            # Fold the oldest runs into a full snapshot so deltas stay reconstructible
+            bitmaps = self._bitmaps[-self.max_runs:]
+            self.runs = [{"time": bitmaps[0][0], "delta": bitmaps[0][1].encode()}] + self.runs[-self.max_runs + 1:]
+            self._bitmaps = bitmaps
+
+    def save(self):
+        try:
+            write_atomic(self.path, json.dumps({"key": self.host_range.key(), "runs": self.runs}))
+        except OSError as e:
+            logging.error(f"Failed to save presence history: {e}")
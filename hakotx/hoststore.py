@@ -0,0 +1,205 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+HOST_STORE = "ips/hosts.db"
+FINGERPRINT_TTL = 7 * 24 * 3600
+
+# What a check saw, enough to re-run the signatures without the device:
+# body_prefix is the start of the raw body, body_size how much of it was read
+# and markers the signature markers found in all of that, prefix or not
+Evidence = namedtuple("Evidence", ["url", "status_line", "headers", "encoding", "body_prefix", "body_size",
+                                   "markers"], defaults=((),))
+
+class HostStore:
+    """Per-host state kept across runs in SQLite: last classification, page hash and when it was seen and checked.
+
+    Alongside it the evidence of the last successful check is kept (status
+    line, selected headers and the start of the body), so the signatures can
+    be re-run offline; see reclassify.py.
+
+    `probe` is the cheap signature the sweep already has for free (the open
+    ports); a host whose probe changed is re-fingerprinted even within the TTL.
+    `server` is the Server header of the last response, "" when it had none,
+    kept for every host that answered so inventory() can audit the fleet.
+    The failures table counts consecutive failures per host or /24 and stage
+    for hakotx.ledger.FailureLedger.
+    The connection is shared between threads behind a lock, and writes are
+    committed by commit() so a run costs one transaction per checkpoint.
+    """
+
+    def __init__(self, path=HOST_STORE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS hosts (
+                ip TEXT PRIMARY KEY,
+                type TEXT,
+                page_md5 TEXT,
+                probe TEXT,
+                first_seen REAL,
+                last_seen REAL,
+                last_checked REAL,
+                server TEXT
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS failures (
+                key TEXT,
+                stage TEXT,
+                count INTEGER,
+                last_failure REAL,
+                PRIMARY KEY (key, stage)
+            )
+        """)
+        # Stores created before the server column was added
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(hosts)")}
+        if "server" not in columns:
+            self.db.execute("ALTER TABLE hosts ADD COLUMN server TEXT")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS evidence (
+                ip TEXT PRIMARY KEY,
+                checked REAL,
+                url TEXT,
+                status_line TEXT,
+                headers TEXT,
+                encoding TEXT,
+                body_prefix BLOB,
+                body_size INTEGER,
+                page_md5 TEXT,
+                markers TEXT
+            )
+        """)
+        # Stores created before the markers column was added
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(evidence)")}
+        if "markers" not in columns:
+            self.db.execute("ALTER TABLE evidence ADD COLUMN markers TEXT")
+        self.db.commit()
+
+    @staticmethod
+    def probe_of(open_ports):
+        return ",".join(str(port) for port in sorted(open_ports)) if open_ports is not None else None
+
+    def cached(self, ip, probe=None, ttl=FINGERPRINT_TTL, now=None):
+        """Returns the stored type of the host if it can be trusted without a new check, else None."""
+        now = now or time.time()
+        with self.lock:
+            row = self.db.execute("SELECT type, probe, last_checked FROM hosts WHERE ip = ?", (ip,)).fetchone()
+        if row is None:
+            return None
+        ip_type, stored_probe, last_checked = row
+        if ip_type is None or last_checked is None or now - last_checked >= ttl:
+            return None
+        if probe is not None and stored_probe is not None and probe != stored_probe:
+            return None
+        return ip_type
+
+    def record_check(self, ip, ip_type, page_md5=None, probe=None, now=None):
+        """Stores the outcome of a fingerprint; ip_type None (a failed check) forces a new check next time."""
+        now = now or time.time()
+        with self.lock:
+            self.db.execute("""
+                INSERT INTO hosts (ip, type, page_md5, probe, first_seen, last_seen, last_checked)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(ip) DO UPDATE SET
+                    type = excluded.type,
+                    page_md5 = excluded.page_md5,
+                    probe = COALESCE(excluded.probe, hosts.probe),
+                    last_seen = excluded.last_seen,
+                    last_checked = excluded.last_checked
+            """, (ip, ip_type, page_md5, probe, now, now, now))
+
+    def record_evidence(self, ip, evidence, page_md5=None, now=None):
+        """Keeps the evidence of the latest successful check of the host, replacing the previous one."""
+        now = now or time.time()
+        with self.lock:
+            self.db.execute("""
+                INSERT OR REPLACE INTO evidence
+                    (ip, checked, url, status_line, headers, encoding, body_prefix, body_size, page_md5, markers)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (ip, now, evidence.url, evidence.status_line, json.dumps(evidence.headers), evidence.encoding,
+                  evidence.body_prefix, evidence.body_size, page_md5, json.dumps(sorted(evidence.markers))))
+
+    def evidence(self):
+        """Yields (ip, type, evidence, page_md5) for every host with stored evidence."""
+        with self.lock:
+            rows = self.db.execute("""
+                SELECT evidence.ip, hosts.type, url, status_line, evidence.headers, encoding,
+                       body_prefix, body_size, evidence.page_md5, markers
+                FROM evidence LEFT JOIN hosts ON hosts.ip = evidence.ip
+            """).fetchall()
+        for ip, ip_type, url, status_line, headers, encoding, body_prefix, body_size, page_md5, markers in rows:
+            yield ip, ip_type, Evidence(url, status_line, json.loads(headers or "{}"), encoding,
+                                        body_prefix or b"", body_size, tuple(json.loads(markers or "[]"))), page_md5
+
+    def record_server(self, ip, server, now=None):
+        """Stores the Server header a host answered with; None (no header) is kept as ""."""
+        now = now or time.time()
+        with self.lock:
+            self.db.execute("""
+                INSERT INTO hosts (ip, server, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                ON CONFLICT(ip) DO UPDATE SET server = excluded.server, last_seen = excluded.last_seen
+            """, (ip, server or "", now, now))
+
+    def inventory(self):
+        """Yields (ip, type, server, open ports or None, last_seen) for every host that answered over HTTP."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT ip, type, server, probe, last_seen FROM hosts WHERE server IS NOT NULL").fetchall()
+        for ip, ip_type, server, probe, last_seen in rows:
+            open_ports = {int(port) for port in probe.split(",") if port} if probe is not None else None
+            yield ip, ip_type, server, open_ports, last_seen
+
+    def record_failure(self, key, stage, now=None):
+        now = now or time.time()
+        with self.lock:
+            self.db.execute("""
+                INSERT INTO failures (key, stage, count, last_failure) VALUES (?, ?, 1, ?)
+                ON CONFLICT(key, stage) DO UPDATE SET count = failures.count + 1, last_failure = excluded.last_failure
+            """, (key, stage, now))
+
+    def clear_failures(self, keys, stage):
+        with self.lock:
+            self.db.executemany("DELETE FROM failures WHERE key = ? AND stage = ?", [(key, stage) for key in keys])
+
+    def failures(self, stage):
+        """Returns {key: (consecutive failures, time of the last one)} for the stage."""
+        with self.lock:
+            rows = self.db.execute("SELECT key, count, last_failure FROM failures WHERE stage = ?", (stage,)).fetchall()
+        return {key: (count, last_failure) for key, count, last_failure in rows}
+
+    def set_type(self, ip, ip_type):
+        with self.lock:
+            self.db.execute("UPDATE hosts SET type = ? WHERE ip = ?", (ip_type, ip))
+
+    def touch(self, hosts, now=None):
+        """Marks the hosts as seen alive in this run.
+
+        `hosts` is a list of IPs, or a dict of IP to open ports to also fill in
+        probes that are not known yet.
+        """
+        now = now or time.time()
+        probes = hosts if isinstance(hosts, dict) else dict.fromkeys(hosts)
+        with self.lock:
+            self.db.executemany("""
+                INSERT INTO hosts (ip, probe, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                ON CONFLICT(ip) DO UPDATE SET
+                    probe = COALESCE(hosts.probe, excluded.probe),
+                    last_seen = excluded.last_seen
+            """, [(ip, self.probe_of(open_ports), now, now) for ip, open_ports in probes.items()])
+
+    def commit(self):
+        with self.lock:
+            try:
+                self.db.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Failed to save the host store: {e}")
+
+    def close(self):
+        self.commit()
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,77 @@
+import logging
+import time
+
+from hakotx.ranges import int_to_ip, ip_to_int
+
+# A host or /24 that failed n times in a row is left alone for
+# BACKOFF_BASE * 2**(n-1) seconds, at most BACKOFF_MAX
+BACKOFF_BASE = 3600
+BACKOFF_MAX = 7 * 24 * 3600
+# Failed hosts of a /24, none succeeding, before the /24 counts as down
+SUBNET_MIN_FAILURES = 4
+
+def backoff(count):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (count - 1))
+
+def subnet_of(ip):
+    return f"{int_to_ip(ip_to_int(ip) & ~0xFF)}/24"
+
+class FailureLedger:
+    """Hosts and /24s that keep failing a stage, skipped across runs with exponential backoff.
+
+    The ledger is kept in the failures table of a HostStore, per `stage`
+    ("fingerprint", or "collect:<model>"). admit() tells whether a host should
+    be tried in this run: not while the host is backing off, and while its
+    /24 is, only the first host asked about, as a canary whose success puts
+    the subnet back in service. record() feeds each outcome; finish() marks
+    the /24s where every host tried failed as down.
+
+    With `enforce` false every host is admitted, but outcomes are still
+    recorded.
+    """
+
+    def __init__(self, store, stage, enforce=True, now=None):
+        self.store = store
+        self.stage = stage
+        self.enforce = enforce
+        self.now = now or time.time()
+        self.blocked = {key for key, (count, last_failure) in store.failures(stage).items()
+                        if self.now - last_failure < backoff(count)}
+        self.skipped = 0
+        self._canaries = set()
+        self._outcomes = {}
+        self._finished = False
+
+    def admit(self, ip):
+        if not self.enforce:
+            return True
+        subnet = subnet_of(ip)
+        if ip in self.blocked or (subnet in self.blocked and subnet in self._canaries):
+            self.skipped += 1
+            return False
+        if subnet in self.blocked:
+            self._canaries.add(subnet)
+        return True
+
+    def record(self, ip, ok):
+        subnet = subnet_of(ip)
+        outcomes = self._outcomes.setdefault(subnet, [0, 0])
+        if ok:
+            outcomes[0] += 1
+            self.store.clear_failures([ip, subnet], self.stage)
+        else:
+            outcomes[1] += 1
+            self.store.record_failure(ip, self.stage, self.now)
+
+    def finish(self):
+        """Records the /24s that are down: no host succeeded and enough failed, or their canary failed."""
+        if self._finished:
+            return
+        self._finished = True
+        down = [subnet for subnet, (succeeded, failed) in self._outcomes.items()
+                if not succeeded and (failed >= SUBNET_MIN_FAILURES or subnet in self._canaries)]
+        for subnet in down:
+            self.store.record_failure(subnet, self.stage, self.now)
+        if self.skipped or down:
+            logging.info(f"{self.stage}: {self.skipped} hosts skipped while backing off after failures, "
+                         f"{len(down)} subnets down in this run")
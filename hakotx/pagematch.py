@@ -0,0 +1,160 @@
+import codecs
+import hashlib
+import re
+from urllib.parse import urlsplit
+
+MAX_FINGERPRINT_BYTES = 256 * 1024
+HEAD_BYTES = 4096
+
+TITLE_PATTERN = re.compile(rb"<title[^>]*>(.*?)</title", re.IGNORECASE | re.DOTALL)
+
+def extract_title(data, encoding=None):
+    """The text of the first <title> in `data`, or None if there is none."""
+    found = TITLE_PATTERN.search(data)
+    if found is None:
+        return None
+    try:
+        return found.group(1).decode(encoding or "utf-8", errors="replace").strip()
+    except LookupError:
+        return found.group(1).decode("utf-8", errors="replace").strip()
+
+class CheapMatch:
+    """The cheap tier of a check: the registry's server, path and title rules.
+
+    decide() can answer from the headers alone; when a candidate also needs
+    the <title>, feed() looks for it in the first HEAD_BYTES of the body.
+    Returns None whenever the tier is ambiguous, or when a signature above
+    its match could still match by hash or markers, so the caller falls back
+    to those; `index` is then the cheap match for the caller to weigh
+    against them in registry order.
+    """
+
+    def __init__(self, registry, server, path, encoding=None):
+        self.registry = registry
+        self.server = server or ""
+        self.path = path or "/"
+        self.encoding = encoding
+        self.title = None
+        self._head = bytearray()
+        matching, pending = registry.cheap_candidates(self.server, self.path)
+        self.wants_title = bool(pending)
+
+    @property
+    def index(self):
+        """The index of the only signature the cheap tier matches, or None."""
+        matching, pending = self.registry.cheap_candidates(self.server, self.path, self.title)
+        if len(matching) == 1 and not pending:
+            return next(iter(matching))
+        return None
+
+    def decide(self):
+        index = self.index
+        if index is not None and index <= self.registry.first_by_page:
+            return self.registry[index]
+        return None
+
+    def feed(self, chunk):
+        """Consumes the start of the body until the title is known; returns a signature once decided."""
+        if not self.wants_title:
+            return None
+        self._head += chunk[:HEAD_BYTES - len(self._head)]
+        self.title = extract_title(self._head, self.encoding)
+        if self.title is None and len(self._head) < HEAD_BYTES:
+            return None
+        if self.title is None:
+            self.title = ""
+        self.wants_title = False
+        return self.decide()
+
+class PageMatcher:
+    """Matches a landing page against a SignatureRegistry while it is still being read.
+
+    Chunks of the raw body go to feed(), which decodes them incrementally,
+    updates the page hash and runs them through the registry's marker
+    automaton. feed() returns a signature once the match is certain, so the
+    caller can stop reading; result() gives the final match in registry order
+    and sets `digest`, the page md5, when the whole page was fed. `markers`
+    are the marker strings found so far. Past `limit` bytes the rest of the
+    page is ignored and no hash can match.
+    """
+
+    def __init__(self, registry, encoding=None, limit=MAX_FINGERPRINT_BYTES):
+        self.registry = registry
+        self.limit = limit
+        try:
+            self._decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._md5 = hashlib.md5()
+        self._state = 0
+        self.size = 0
+        self.truncated = False
+        self.seen = set()
+        self.markers = set()
+        self.digest = None
+
+    def _scan(self, text):
+        self._md5.update(text.encode())
+        self._state, found = self.registry.automaton.scan(text, self._state)
+        if found:
+            self.markers |= found
+            self.seen |= {self.registry.markers[marker] for marker in found}
+
+    def feed(self, chunk):
+        """Consumes the next chunk of the body; returns the signature once the match is certain."""
+        if self.limit is not None and self.size + len(chunk) > self.limit:
+            chunk = chunk[:self.limit - self.size]
+            self.truncated = True
+        self.size += len(chunk)
+        self._scan(self._decoder.decode(chunk))
+
+        if self.seen and self.registry[min(self.seen)].conclusive:
+            return self.registry[min(self.seen)]
+        return None
+
+    def result(self, cheap=None):
+        """The best match for everything fed so far, or None for an unknown page.
+
+        `cheap` is the index the cheap tier matched, if any, weighed with the rest.
+        """
+        self._scan(self._decoder.decode(b"", final=True))
+        candidates = set(self.seen)
+        if cheap is not None:
+            candidates.add(cheap)
+        if not self.truncated:
+            self.digest = self._md5.hexdigest()
+            index = self.registry.by_md5.get(self.digest)
+            if index is not None:
+                candidates.add(index)
+        return self.registry[min(candidates)] if candidates else None
+
+def match_evidence(registry, evidence, digest=None):
+    """Re-runs the registry over stored evidence (hakotx.hoststore.Evidence) without fetching the page again.
+
+    The cheap tier sees the stored Server header, URL and body prefix; markers
+    are looked for in the prefix and among the markers the check found in the
+    whole read, and hashes compared with `digest`, the md5 of the whole page
+    recorded at the time, which is None when the page was not read to the end.
+    """
+    cheap = CheapMatch(registry, evidence.headers.get("server"), urlsplit(evidence.url or "/").path,
+                       evidence.encoding)
+    signature = cheap.decide() or cheap.feed(evidence.body_prefix[:HEAD_BYTES])
+    if signature is not None:
+        return signature
+
+    matcher = PageMatcher(registry, evidence.encoding, limit=None)
+    matcher.feed(evidence.body_prefix)
+    # The prefix's own hash is not the page hash, only the stored digest is
+    matcher.truncated = True
+    matcher.result()
+    candidates = set(matcher.seen)
+    if cheap.index is not None:
+        candidates.add(cheap.index)
+    candidates.update(registry.markers[marker] for marker in evidence.markers if marker in registry.markers)
+    if digest in registry.by_md5:
+        candidates.add(registry.by_md5[digest])
+    return registry[min(candidates)] if candidates else None
+
+def evidence_is_complete(evidence, digest=None):
+    """Whether the evidence holds the whole page, so that matching nothing in it means the page is unknown."""
+    return digest is not None and evidence.body_size is not None and len(evidence.body_prefix) >= evidence.body_size
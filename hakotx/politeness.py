@@ -0,0 +1,169 @@
+import asyncio
+import configparser
+import time
+from collections import OrderedDict, deque, namedtuple
+from contextlib import asynccontextmanager
+
+from hakotx.ranges import CONFIG_FILE, ip_to_int
+
+# Connections allowed at once to one device and to one /24 (0 for no cap), and
+# requests per second to one /24 (0 for no limit)
+PolitenessSettings = namedtuple("PolitenessSettings", ["per_host", "per_subnet", "subnet_rate"])
+
+def load_politeness(config_file=CONFIG_FILE):
+    """Reads [politeness] per_host, per_subnet and subnet_rate."""
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    return PolitenessSettings(
+        per_host=config.getint('politeness', 'per_host', fallback=1),
+        per_subnet=config.getint('politeness', 'per_subnet', fallback=16),
+        subnet_rate=config.getfloat('politeness', 'subnet_rate', fallback=0),
+    )
+
+def _subnet(host):
+    try:
+        return ip_to_int(host) >> 8
+    except OSError:
+        # A name, e.g. from a redirect: it counts as its own subnet
+        return host
+
+class PolitenessLimiter:
+    """Caps how hard one device and one /24 are hit, whatever the global concurrency.
+
+    slot(ip) holds one of the device's `per_host` connections and one of its
+    /24's `per_subnet` for as long as the caller talks to it; pace(ip) spaces
+    requests to a /24 at least 1/`subnet_rate` seconds apart. Raising the
+    global concurrency then spreads the extra work over more subnets instead
+    of piling it on the same devices.
+
+    fair(hosts) hands out hosts only once slot() would admit them at once,
+    taking the /24s in turn, so a caller bounding its started tasks counts
+    only tasks that hold a slot rather than tasks queued behind one subnet.
+
+    Gates are created on first use and dropped when idle. The limiter is for
+    one event loop; create it inside the loop that uses it.
+    """
+
+    def __init__(self, per_host=1, per_subnet=16, subnet_rate=0):
+        self.per_host = per_host
+        self.per_subnet = per_subnet
+        self.subnet_rate = subnet_rate
+        self._gates = {}
+        self._next_request = {}
+        self._released = None
+
+    def _enter(self, key, size):
+        gate = self._gates.get(key)
+        if gate is None:
+            gate = self._gates[key] = [asyncio.Semaphore(size), 0]
+        gate[1] += 1
+        return gate
+
+    def _leave(self, key, gate):
+        gate[1] -= 1
+        if gate[1] == 0:
+            del self._gates[key]
+
+    def _keys(self, ip):
+        # The device first, so waiting for a busy device does not take up a slot of its subnet
+        keys = []
+        if self.per_host:
+            keys.append((("host", ip), self.per_host))
+        if self.per_subnet:
+            keys.append((("subnet", _subnet(ip)), self.per_subnet))
+        return keys
+
+    def free(self, ip):
+        """Whether slot(ip) would be granted without waiting, counting those already waiting."""
+        return not any(self._full(key, size) for key, size in self._keys(ip))
+
+    def _full(self, key, size):
+        gate = self._gates.get(key)
+        return gate is not None and gate[1] >= size
+
+    async def _wait_release(self):
+        if self._released is None or self._released.done():
+            self._released = asyncio.get_running_loop().create_future()
+        await self._released
+
+    @asynccontextmanager
+    async def slot(self, ip):
+        gates = [(key, self._enter(key, size)) for key, size in self._keys(ip)]
+        acquired = []
+        try:
+            for _, gate in gates:
+                await gate[0].acquire()
+                acquired.append(gate)
+            yield
+        finally:
+            for gate in acquired:
+                gate[0].release()
+            for key, gate in gates:
+                self._leave(key, gate)
+            if self._released is not None and not self._released.done():
+                self._released.set_result(None)
+
+    async def fair(self, hosts):
+        """Yields the hosts of a plain or async iterable, each once slot() would admit it at once.
+
+        Hosts whose device or /24 is busy are held back while the next /24
+        in turn is served; the caller is expected to enter slot() for a host
+        before asking for the next one. Hosts are read from `hosts` only when
+        none held back can go.
+        """
+        if hasattr(hosts, "__aiter__"):
+            source = hosts.__aiter__()
+            pull = source.__anext__
+        else:
+            source = iter(hosts)
+
+            async def pull():
+                try:
+                    return next(source)
+                except StopIteration:
+                    raise StopAsyncIteration
+        waiting = OrderedDict()
+        exhausted = False
+        while waiting or not exhausted:
+            # Let the caller's task for the last host take its slot first
+            await asyncio.sleep(0)
+            ip = self._take_free(waiting)
+            if ip is None and not exhausted:
+                try:
+                    ip = await pull()
+                except StopAsyncIteration:
+                    exhausted = True
+                    continue
+                if not self.free(ip):
+                    waiting.setdefault(_subnet(ip), deque()).append(ip)
+                    continue
+            if ip is None:
+                await self._wait_release()
+                continue
+            yield ip
+
+    def _take_free(self, waiting):
+        """Takes the first free host of the first /24 in turn that has one, and sends that /24 to the back."""
+        for subnet, queue in waiting.items():
+            if self.per_subnet and self._full(("subnet", subnet), self.per_subnet):
+                continue
+            for i, ip in enumerate(queue):
+                if self.free(ip):
+                    del queue[i]
+                    if queue:
+                        waiting.move_to_end(subnet)
+                    else:
+                        del waiting[subnet]
+                    return ip
+        return None
+
+    async def pace(self, ip):
+        """Waits until the /24 of `ip` may receive another request."""
+        if not self.subnet_rate:
+            return
+        subnet = _subnet(ip)
+        now = time.monotonic()
+        at = max(now, self._next_request.get(subnet, now))
+        self._next_request[subnet] = at + 1 / self.subnet_rate
+        if at > now:
+            await asyncio.sleep(at - now)
@@ -0,0 +1,55 @@
+import configparser
+import logging
+
+from hakotx.files import write_atomic
+from hakotx.ranges import CONFIG_FILE
+
+OPEN_PORTS_FILE = "ips/alive_ports.txt"
+
+def load_sweep_ports(config_file=CONFIG_FILE):
+    """Reads the TCP ports probed per host from [sweep] ports (default: 80)."""
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    value = config.get('sweep', 'ports', fallback='80')
+    return tuple(int(port) for port in value.replace(",", " ").split())
+
+def save_open_ports(open_ports, probed, path=OPEN_PORTS_FILE):
+    """Writes one `ip port,port` line per alive host, after a header naming the probed ports."""
+    lines = [f"# probed {','.join(map(str, probed))}"]
+    lines.extend(f"{ip} {','.join(map(str, ports))}" for ip, ports in open_ports.items())
+    try:
+        write_atomic(path, "\n".join(lines) + "\n")
+        logging.info(f"Open ports saved to {path}")
+    except OSError as e:
+        logging.error(f"Failed to save open ports: {e}")
+
+class OpenPorts:
+    """Open ports recorded by the sweep, used to skip hosts that cannot serve a stage."""
+
+    def __init__(self, path=OPEN_PORTS_FILE):
+        self.probed = set()
+        self.ports = {}
+        try:
+            with open(path, "r") as file:
+                for line in file:
+                    line = line.strip()
+                    if line.startswith("# probed "):
+                        self.probed = {int(port) for port in line[len("# probed "):].split(",") if port}
+                    elif line:
+                        ip, _, ports = line.partition(" ")
+                        self.ports[ip] = {int(port) for port in ports.split(",") if port}
+        except FileNotFoundError:
+            pass
+
+    def exposes(self, ip, port):
+        """False only when the sweep probed `port` on this host and found it closed."""
+        ports = self.ports.get(ip.strip())
+        if ports is None or port not in self.probed:
+            return True
+        return port in ports
+
+    def filter(self, ip_list, port):
+        kept = [ip for ip in ip_list if self.exposes(ip, port)]
+        if len(kept) < len(ip_list):
+            logging.info(f"Skipping {len(ip_list) - len(kept)} hosts without port {port} open")
+        return kept
@@ -0,0 +1,158 @@
+import bisect
+import configparser
+import ipaddress
+import os
+import socket
+import struct
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', '.config.properties')
+
+DEFAULT_RANGES = "172.17.0.0/20, 172.18.0.0/20, 10.17.0.0/20, 10.18.0.0/20"
+
+def _split_list(value):
+    return [item.strip() for item in value.replace("\n", ",").split(",") if item.strip()]
+
+def _intervals(cidrs):
+    """Turns CIDR strings into sorted, merged (first, last) integer intervals."""
+    spans = []
+    for cidr in cidrs:
+        network = ipaddress.IPv4Network(cidr, strict=False)
+        spans.append((int(network.network_address), int(network.broadcast_address)))
+    spans.sort()
+
+    merged = []
+    for lo, hi in spans:
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+def _subtract(intervals, excluded):
+    """Removes the excluded intervals from the given ones."""
+    result = []
+    for lo, hi in intervals:
+        for ex_lo, ex_hi in excluded:
+            if ex_hi < lo or ex_lo > hi:
+                continue
+            if ex_lo > lo:
+                result.append((lo, ex_lo - 1))
+            lo = ex_hi + 1
+            if lo > hi:
+                break
+        if lo <= hi:
+            result.append((lo, hi))
+    return result
+
+def int_to_ip(value):
+    return socket.inet_ntoa(struct.pack("!I", value))
+
+def ip_to_int(ip):
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+class HostRange:
+    """Lazily enumerates the addresses of a set of networks.
+
+    Only the merged integer intervals are kept in memory; dotted-quad strings
+    are produced one at a time while iterating, so a /16 costs the same as a /24.
+    """
+
+    def __init__(self, networks, exclude=(), skip_octets=()):
+        self.intervals = _subtract(_intervals(networks), _intervals(exclude))
+        self.skip_octets = frozenset(skip_octets)
+
+    def __iter__(self):
+        skip = self.skip_octets
+        for lo, hi in self.intervals:
+            for value in range(lo, hi + 1):
+                if skip and value & 0xFF in skip:
+                    continue
+                yield int_to_ip(value)
+
+    def _count(self, lo, hi):
+        """Number of addresses in [lo, hi] whose last octet is not filtered out."""
+        total = hi - lo + 1
+        if not self.skip_octets:
+            return total
+        blocks, rest = divmod(total, 256)
+        skipped = blocks * len(self.skip_octets)
+        start = (lo + blocks * 256) & 0xFF
+        skipped += sum(1 for octet in self.skip_octets if (octet - start) % 256 < rest)
+        return total - skipped
+
+    def __len__(self):
+        return sum(self._count(lo, hi) for lo, hi in self.intervals)
+
+    def _with_intervals(self, intervals):
+        shard = HostRange.__new__(HostRange)
+        shard.intervals = intervals
+        shard.skip_octets = self.skip_octets
+        return shard
+
+    def blocks(self):
+        """Yields the /24 blocks (address >> 8) the range touches, in address order."""
+        last = None
+        for lo, hi in self.intervals:
+            for block in range(lo >> 8, (hi >> 8) + 1):
+                if block != last:
+                    yield block
+                    last = block
+
+    def block_addresses(self, block):
+        """Returns the integer addresses of the range inside one /24 block."""
+        first = block << 8
+        last = first | 0xFF
+        addresses = []
+        index = max(0, bisect.bisect_right(self.intervals, (first, last)) - 1)
+        for lo, hi in self.intervals[index:]:
+            if lo > last:
+                break
+            for value in range(max(lo, first), min(hi, last) + 1):
+                if value & 0xFF not in self.skip_octets:
+                    addresses.append(value)
+        return addresses
+
+    def excluding(self, intervals):
+        """Returns a copy without the given sorted [first, last] integer intervals."""
+        return self._with_intervals(_subtract(self.intervals, intervals))
+
+    def key(self):
+        """Stable description of the address space, used to match checkpoints to configurations."""
+        return {"intervals": [list(span) for span in self.intervals], "skip_octets": sorted(self.skip_octets)}
+
+    def split(self, count):
+        """Splits the range into at most `count` shards of similar size, cut on /24 boundaries."""
+        total = sum(hi - lo + 1 for lo, hi in self.intervals)
+        target = max(256, -(-total // max(1, count)))
+
+        shards = []
+        current = []
+        size = 0
+        for lo, hi in self.intervals:
+            while lo <= hi:
+                end = min(hi, (lo + target - size - 1) | 0xFF)
+                current.append((lo, end))
+                size += end - lo + 1
+                lo = end + 1
+                if size >= target:
+                    shards.append(self._with_intervals(current))
+                    current = []
+                    size = 0
+        if current:
+            shards.append(self._with_intervals(current))
+        return shards
+
+    def __repr__(self):
+        spans = ", ".join(f"{int_to_ip(lo)}-{int_to_ip(hi)}" for lo, hi in self.intervals)
+        return f"HostRange({spans})"
+
+def load_host_range(config_file=CONFIG_FILE):
+    """Builds the sweep HostRange from the [sweep] section of .config.properties."""
+    config = configparser.ConfigParser()
+    config.read(config_file)
+
+    networks = _split_list(config.get('sweep', 'ranges', fallback=DEFAULT_RANGES))
+    exclude = _split_list(config.get('sweep', 'exclude', fallback=""))
+    skip_octets = [int(octet) for octet in _split_list(config.get('sweep', 'skip_octets', fallback=""))]
+
+    return HostRange(networks, exclude, skip_octets)
@@ -0,0 +1,423 @@
+import asyncio
+import errno
+import time
+import zlib
+from collections import namedtuple
+from urllib.parse import urlencode, urljoin, urlsplit
+
+HTTP_PORT = 80
+MAX_RESPONSE_BYTES = 1024 * 1024
+MAX_DOWNLOAD_BYTES = 16 * 1024 * 1024
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+RawResponse = namedtuple("RawResponse", ["status", "headers", "body"])
+
+def build_request(host, path="/", method="GET", headers=None, body=b""):
+    """Serializes a request; `headers` are added to, or override, the defaults."""
+    fields = {"Host": host, "User-Agent": "Mozilla/5.0", "Accept": "*/*", "Connection": "close"}
+    fields.update(headers or {})
+    if body or method not in ("GET", "HEAD"):
+        fields["Content-Length"] = str(len(body))
+    head = f"{method} {path} HTTP/1.1\r\n" + "".join(f"{name}: {value}\r\n" for name, value in fields.items())
+    return (head + "\r\n").encode() + body
+
+def _dechunk(data):
+    body = bytearray()
+    while True:
+        line, sep, rest = data.partition(b"\r\n")
+        if not sep:
+            return None
+        size = int(line.split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            return bytes(body)
+        if len(rest) < size:
+            return None
+        body += rest[:size]
+        data = rest[size + 2:]
+
+def parse_response(data):
+    """Parses a complete HTTP/1.x response; returns None when it is cut short or malformed."""
+    head, sep, body = data.partition(b"\r\n\r\n")
+    if not sep:
+        return None
+    lines = head.decode("iso-8859-1").split("\r\n")
+    try:
+        status = int(lines[0].split()[1])
+    except (IndexError, ValueError):
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            body = _dechunk(body)
+            if body is None:
+                return None
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            if len(body) < length:
+                return None
+            body = body[:length]
+        encoding = headers.get("content-encoding", "").lower()
+        if encoding in ("gzip", "deflate"):
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS)
+    except (ValueError, zlib.error):
+        return None
+    return RawResponse(status, headers, body)
+
+def encoding_from_headers(headers):
+    """The body encoding requests would pick from the headers alone, or None where it would guess."""
+    content_type = headers.get("content-type", "")
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "charset" and value:
+            return value.strip("'\"")
+    if "text" in content_type:
+        return "iso-8859-1"
+    return None
+
+def decode_body(response):
+    """Decodes the body the way requests' Response.text does for the pages we fingerprint.
+
+    The charset of the Content-Type wins, text/* without one is ISO-8859-1. Where
+    requests would guess the encoding, UTF-8 is tried before falling back to ISO-8859-1.
+    """
+    encoding = encoding_from_headers(response.headers)
+    if encoding is not None:
+        try:
+            return response.body.decode(encoding, errors="replace")
+        except LookupError:
+            pass
+    try:
+        return response.body.decode("utf-8")
+    except UnicodeDecodeError:
+        return response.body.decode("iso-8859-1")
+
+async def fetch_on_socket(sock, host, timeout, limit=MAX_RESPONSE_BYTES):
+    """Sends `GET /` on an already connected non-blocking socket and reads the response.
+
+    Returns a RawResponse, or None when the host does not answer completely within `timeout` seconds.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def exchange():
+        await loop.sock_sendall(sock, build_request(host))
+        data = bytearray()
+        while len(data) < limit:
+            chunk = await loop.sock_recv(sock, 65536)
+            if not chunk:
+                break
+            data += chunk
+        return parse_response(bytes(data))
+
+    try:
+        return await asyncio.wait_for(exchange(), timeout)
+    except (asyncio.TimeoutError, OSError):
+        return None
+
+# Failures of this machine rather than of the host: out of descriptors or socket buffers
+LOCAL_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS}
+# Failures on the way to a host that suggest too much in flight, unlike refusals or malformed replies
+CONGESTION_ERRORS = (asyncio.TimeoutError, TimeoutError, ConnectionResetError, ConnectionAbortedError)
+
+class FetchError(Exception):
+    """The page could not be fetched: no connection, a timeout or a malformed response."""
+
+    @property
+    def local(self):
+        """Whether the fetch failed for lack of local resources, which says nothing about the host."""
+        cause = self.__cause__
+        if isinstance(cause, FetchError):
+            return cause.local
+        return isinstance(cause, OSError) and cause.errno in LOCAL_ERRNOS
+
+    @property
+    def congestion(self):
+        """Whether the failure points at congestion: timeouts, resets, or a lack of local resources."""
+        cause = self.__cause__
+        if isinstance(cause, FetchError):
+            return cause.congestion
+        return self.local or isinstance(cause, CONGESTION_ERRORS)
+
+    @property
+    def transport(self):
+        """Whether the failure happened below HTTP: a timeout or a failed or broken connection."""
+        cause = self.__cause__
+        if isinstance(cause, FetchError):
+            return cause.transport
+        return isinstance(cause, (asyncio.TimeoutError, TimeoutError, OSError))
+
+def _parse_head(head):
+    """Splits a response head into (status line, status, headers, cookies set by it)."""
+    lines = head.decode("iso-8859-1").split("\r\n")
+    try:
+        status = int(lines[0].split()[1])
+    except (IndexError, ValueError):
+        raise FetchError(f"bad status line {lines[0]!r}")
+    headers = {}
+    cookies = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            name, value = name.strip().lower(), value.strip()
+            headers[name] = value
+            if name == "set-cookie":
+                cookie_name, _, cookie_value = value.partition(";")[0].partition("=")
+                if cookie_name.strip():
+                    cookies[cookie_name.strip()] = cookie_value.strip()
+    return lines[0], status, headers, cookies
+
+class PageStream:
+    """An HTTP response whose headers have been read and whose body is read on demand.
+
+    Every read waits at most `timeout` seconds, like the read timeout of
+    requests, and only one chunk is held at a time, so the memory a response
+    costs does not depend on the size of the page. `complete` turns true once
+    a body of known length has been read to its end, leaving the connection
+    ready for another request.
+    """
+
+    def __init__(self, reader, writer, url, status_line, status, headers, elapsed, timeout, cookies=None):
+        self.reader = reader
+        self.writer = writer
+        self.url = url
+        self.status_line = status_line
+        self.status = status
+        self.headers = headers
+        self.elapsed = elapsed
+        self.timeout = timeout
+        self.cookies = cookies or {}
+        self.encoding = encoding_from_headers(headers)
+        self.complete = False
+
+    async def _read(self, call):
+        try:
+            return await asyncio.wait_for(call, self.timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError) as e:
+            raise FetchError(f"reading the body failed: {e!r}") from e
+
+    async def _raw_chunks(self, size):
+        if "chunked" in self.headers.get("transfer-encoding", "").lower():
+            while True:
+                line = await self._read(self.reader.readline())
+                try:
+                    length = int(line.split(b";")[0].strip() or b"0", 16)
+                except ValueError:
+                    raise FetchError(f"bad chunk size {line!r}")
+                if length == 0:
+                    # Trailers, if any, end with an empty line
+                    while (await self._read(self.reader.readline())).strip():
+                        pass
+                    self.complete = True
+                    return
+                # A chunk may be declared arbitrarily large, so it is read in pieces too
+                while length > 0:
+                    piece = await self._read(self.reader.readexactly(min(size, length)))
+                    length -= len(piece)
+                    yield piece
+                await self._read(self.reader.readline())
+        elif "content-length" in self.headers:
+            try:
+                remaining = int(self.headers["content-length"])
+            except ValueError:
+                raise FetchError(f"bad Content-Length {self.headers['content-length']!r}")
+            while remaining > 0:
+                chunk = await self._read(self.reader.read(min(size, remaining)))
+                if not chunk:
+                    raise FetchError("connection closed before the end of the body")
+                remaining -= len(chunk)
+                yield chunk
+            self.complete = True
+        else:
+            while True:
+                chunk = await self._read(self.reader.read(size))
+                if not chunk:
+                    return
+                yield chunk
+
+    async def chunks(self, size=4096):
+        """Yields the decoded body in chunks of about `size` bytes."""
+        encoding = self.headers.get("content-encoding", "").lower()
+        decompressor = None
+        if encoding in ("gzip", "deflate"):
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS)
+        async for chunk in self._raw_chunks(size):
+            if decompressor is not None:
+                try:
+                    chunk = decompressor.decompress(chunk)
+                except zlib.error as e:
+                    raise FetchError(f"bad {encoding} body: {e}") from e
+            if chunk:
+                yield chunk
+
+    @property
+    def reusable(self):
+        """Whether the connection can carry another request once the body has been read."""
+        return (self.complete and self.status_line.startswith("HTTP/1.1")
+                and self.headers.get("connection", "").lower() != "close")
+
+    def close(self):
+        self.writer.close()
+
+async def _connect(host, port, connect_timeout):
+    try:
+        return await asyncio.wait_for(asyncio.open_connection(host, port), connect_timeout)
+    except (asyncio.TimeoutError, OSError) as e:
+        raise FetchError(f"connecting failed: {e!r}") from e
+
+async def _exchange(reader, writer, request, timeout):
+    """Sends a serialized request and reads the response head; the writer is closed if that fails."""
+    try:
+        writer.write(request)
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        return _parse_head(head)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError) as e:
+        writer.close()
+        raise FetchError(f"reading the response failed: {e!r}") from e
+    except FetchError:
+        writer.close()
+        raise
+
+def _host_header(host, port):
+    return host if port == HTTP_PORT else f"{host}:{port}"
+
+async def _request(host, port, path, connect_timeout, timeout):
+    started = time.monotonic()
+    reader, writer = await _connect(host, port, connect_timeout)
+    status_line, status, headers, cookies = await _exchange(
+        reader, writer, build_request(_host_header(host, port), path), timeout)
+    url = f"http://{host}{'' if port == HTTP_PORT else f':{port}'}{path}"
+    return PageStream(reader, writer, url, status_line, status, headers, time.monotonic() - started, timeout,
+                      cookies)
+
+async def open_page(host, port=HTTP_PORT, path="/", connect_timeout=4, timeout=4, max_redirects=MAX_REDIRECTS):
+    """Sends GET `path` and returns a PageStream once the headers are in, following redirects like requests.
+
+    Raises FetchError on connection problems, timeouts, malformed responses,
+    too many redirects or a redirect to anything but plain HTTP.
+    """
+    url = f"http://{host}:{port}{path}"
+    for _ in range(max_redirects + 1):
+        page = await _request(host, port, path, connect_timeout, timeout)
+        location = page.headers.get("location")
+        if page.status not in REDIRECT_STATUSES or not location:
+            return page
+        page.close()
+
+        url = urljoin(url, location)
+        target = urlsplit(url)
+        if target.scheme != "http" or not target.hostname:
+            raise FetchError(f"redirect to unsupported location {url}")
+        host, port = target.hostname, target.port or HTTP_PORT
+        path = (target.path or "/") + (f"?{target.query}" if target.query else "")
+    raise FetchError(f"more than {max_redirects} redirects")
+
+class Response(namedtuple("Response", ["url", "status", "headers", "body"])):
+    """A complete response read by HTTPSession."""
+
+    @property
+    def text(self):
+        return decode_body(self)
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise FetchError(f"HTTP {self.status} from {self.url}")
+
+class HTTPSession:
+    """What requests.Session does for the collectors, on asyncio: cookies and keep-alive connections.
+
+    One session talks to one device. Cookies set by its responses are sent
+    back on later requests, and a connection whose response was read to the
+    end is reused by the next request to the same host, so a login followed
+    by a download costs one TCP handshake where the device allows it.
+    Redirects are followed like requests does, turning a POST into a GET on
+    301, 302 and 303. Failures raise FetchError. `pace`, if given, is awaited
+    with the host before every request (see hakotx.politeness).
+    """
+
+    def __init__(self, headers=None, connect_timeout=4, timeout=10, max_body=MAX_DOWNLOAD_BYTES, pace=None):
+        self.headers = dict(headers or {})
+        self.pace = pace
+        self.cookies = {}
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.max_body = max_body
+        self._idle = {}
+
+    async def _send(self, method, host, port, path, body, headers):
+        fields = dict(self.headers)
+        fields["Connection"] = "keep-alive"
+        if self.cookies:
+            fields["Cookie"] = "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+        fields.update(headers or {})
+        request = build_request(_host_header(host, port), path, method, fields, body)
+
+        if self.pace is not None:
+            await self.pace(host)
+        started = time.monotonic()
+        connection = self._idle.pop((host, port), None)
+        head = None
+        if connection is not None:
+            # The device may have dropped the idle connection; retry once on a new one
+            try:
+                head = await _exchange(*connection, request, self.timeout)
+            except FetchError:
+                pass
+        if head is None:
+            connection = await _connect(host, port, self.connect_timeout)
+            head = await _exchange(*connection, request, self.timeout)
+        status_line, status, response_headers, cookies = head
+        return PageStream(*connection, f"http://{_host_header(host, port)}{path}", status_line, status,
+                          response_headers, time.monotonic() - started, self.timeout, cookies)
+
+    async def request(self, method, url, data=None, headers=None, max_redirects=MAX_REDIRECTS):
+        """Sends the request and reads the whole response; `data` is a dict to form-encode, str or bytes."""
+        if isinstance(data, dict):
+            data = urlencode(data)
+        body = data.encode() if isinstance(data, str) else (data or b"")
+
+        for _ in range(max_redirects + 1):
+            target = urlsplit(url)
+            if target.scheme != "http" or not target.hostname:
+                raise FetchError(f"unsupported URL {url}")
+            host, port = target.hostname, target.port or HTTP_PORT
+            path = (target.path or "/") + (f"?{target.query}" if target.query else "")
+
+            page = await self._send(method, host, port, path, body, headers)
+            content = bytearray()
+            try:
+                async for chunk in page.chunks(65536):
+                    content += chunk
+                    if len(content) > self.max_body:
+                        raise FetchError(f"response from {url} is larger than {self.max_body} bytes")
+            except FetchError:
+                page.close()
+                raise
+            if page.reusable:
+                self._idle[host, port] = (page.reader, page.writer)
+            else:
+                page.close()
+            self.cookies.update(page.cookies)
+            response = Response(url, page.status, page.headers, bytes(content))
+
+            location = page.headers.get("location")
+            if page.status not in REDIRECT_STATUSES or not location:
+                return response
+            url = urljoin(url, location)
+            if page.status in (301, 302, 303) and method != "HEAD":
+                method, body = "GET", b""
+        raise FetchError(f"more than {max_redirects} redirects")
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, data=None, **kwargs):
+        return await self.request("POST", url, data, **kwargs)
+
+    def close(self):
+        for reader, writer in self._idle.values():
+            writer.close()
+        self._idle.clear()
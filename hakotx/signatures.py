@@ -0,0 +1,179 @@
+import configparser
+import io
+import logging
+import os
+from collections import deque, namedtuple
+
+from hakotx.files import write_atomic
+
+SIGNATURES_FILE = os.path.join(os.path.dirname(__file__), '..', 'signatures.properties')
+LEARNED_FILE = os.path.join(os.path.dirname(__file__), '..', 'signatures.learned.properties')
+
+# md5 is taken over the whole page as UTF-8 text; markers are substrings of it.
+# A conclusive marker decides the match as soon as it is seen, without waiting
+# for the hashes of higher-priority signatures.
+# server, path and title are the cheap tier: substrings of the Server header,
+# of the URL path after redirects and of the page <title>. A signature with any
+# of them matches cheaply when every kind it lists matches.
+Signature = namedtuple("Signature", ["type", "name", "md5", "markers", "conclusive", "server", "path", "title"],
+                       defaults=((), (), ()))
+CHEAP_RULES = ("server", "path", "title")
+
+class MarkerAutomaton:
+    """Aho-Corasick automaton that finds every marker of every signature in one pass.
+
+    Matching is resumable: scan() takes and returns the automaton state, so a
+    page can be fed chunk by chunk and markers split across chunks are found.
+    """
+
+    def __init__(self, patterns):
+        """`patterns` maps each marker string to the value reported when it is found."""
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        for pattern, value in patterns.items():
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].add(value)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def scan(self, text, state=0):
+        """Returns (state, values of the markers that end inside `text`)."""
+        found = set()
+        goto, fail, output = self.goto, self.fail, self.output
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return state, found
+
+class SignatureRegistry:
+    """The device signatures in priority order, indexed for lookups that do not grow with their number.
+
+    Full-page hashes resolve through a dict and all markers through one
+    MarkerAutomaton, which reports the marker strings found; `markers` maps
+    each to the index of its signature. A match is reported as that index,
+    and the lowest index wins.
+    """
+
+    def __init__(self, signatures):
+        self.signatures = list(signatures)
+        self.by_md5 = {}
+        self.markers = {}
+        for index, signature in enumerate(self.signatures):
+            if signature.md5:
+                self.by_md5.setdefault(signature.md5.lower(), index)
+            for marker in signature.markers:
+                self.markers.setdefault(marker, index)
+        self.automaton = MarkerAutomaton({marker: marker for marker in self.markers})
+        self.cheap = [index for index, signature in enumerate(self.signatures)
+                      if signature.server or signature.path or signature.title]
+        # Signatures up to here cannot be outranked by a hash or marker match
+        self.first_by_page = next((index for index, signature in enumerate(self.signatures)
+                                   if signature.md5 or signature.markers), len(self.signatures))
+
+    def __iter__(self):
+        return iter(self.signatures)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __getitem__(self, index):
+        return self.signatures[index]
+
+    def types(self):
+        """Distinct device types in priority order."""
+        return list(dict.fromkeys(signature.type for signature in self.signatures))
+
+    def cheap_candidates(self, server, path, title=None):
+        """Returns (matching, pending) signature indexes of the cheap tier.
+
+        `pending` are the signatures whose other rules match but that also list
+        a title rule while the title is not known yet (title None).
+        """
+        matching = set()
+        pending = set()
+        for index in self.cheap:
+            signature = self.signatures[index]
+            state = matching
+            for rules, value in ((signature.server, server), (signature.path, path), (signature.title, title)):
+                if not rules:
+                    continue
+                if value is None:
+                    state = pending
+                elif not any(rule in value for rule in rules):
+                    state = None
+                    break
+            if state is not None:
+                state.add(index)
+        return matching, pending
+
+def _config():
+    config = configparser.ConfigParser(interpolation=None, comment_prefixes=(";",), empty_lines_in_values=False)
+    config.optionxform = str
+    return config
+
+def _lines(options, key):
+    return tuple(line.strip() for line in options.get(key, "").splitlines() if line.strip())
+
+def load_signatures(path=SIGNATURES_FILE, learned_path=LEARNED_FILE):
+    """Reads the registry: one section per signature, checked in file order.
+
+    Each section names the device type it identifies (defaulting to the
+    section name) and has an md5 of the full page, one or more markers (one
+    per line), cheap-tier rules, or any mix of them. Cheap-tier rules learned
+    from stored evidence (reclassify.py --learn) are added from `learned_path`
+    to the signatures of the type named by each of its sections.
+    """
+    config = _config()
+    if not config.read(path):
+        logging.error(f"Signature registry {path} not found, every page will be unknown")
+
+    signatures = []
+    for section in config.sections():
+        options = config[section]
+        signatures.append(Signature(
+            type=options.get("type", section),
+            name=options.get("name", section),
+            md5=options.get("md5") or None,
+            markers=_lines(options, "markers"),
+            conclusive=options.getboolean("conclusive", False),
+            **{kind: _lines(options, kind) for kind in CHEAP_RULES},
+        ))
+
+    learned = _config()
+    if learned_path and learned.read(learned_path):
+        for index, signature in enumerate(signatures):
+            if learned.has_section(signature.type):
+                options = learned[signature.type]
+                signatures[index] = signature._replace(
+                    **{kind: getattr(signature, kind) + _lines(options, kind) for kind in CHEAP_RULES})
+    return SignatureRegistry(signatures)
+
+def save_learned_rules(rules, path=LEARNED_FILE):
+    """Writes cheap-tier rules as {type: {kind: [values]}} for load_signatures to pick up."""
+    config = _config()
+    for ip_type, kinds in sorted(rules.items()):
+        config[ip_type] = {kind: "\n".join(values) for kind, values in kinds.items() if values}
+    text = io.StringIO()
+    text.write("; Learned by reclassify.py --learn from stored evidence; edits are overwritten\n\n")
+    config.write(text)
+    write_atomic(path, text.getvalue())
@@ -0,0 +1,64 @@
+import threading
+from collections import deque
+
+from hakotx.ranges import ip_to_int
+
+class AdaptiveTimeout:
+    """Per-subnet connect timeout estimated from the RTTs observed so far.
+
+    The timeout for an address is a high percentile of the recent RTTs seen in
+    its /24, times `multiplier`, plus `margin`, clamped to [floor, ceiling].
+    Subnets without enough samples fall back to their /16, and then to
+    `default`, so dead space next to live ONUs is not waited out in full.
+    """
+
+    def __init__(self, default, floor=0.5, ceiling=None, percentile=0.95,
+                 multiplier=2.0, margin=0.2, window=64, min_samples=5):
+        self.default = default
+        self.floor = floor
+        self.ceiling = default if ceiling is None else ceiling
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.margin = margin
+        self.window = window
+        self.min_samples = min_samples
+        self.samples = {}
+        self.estimates = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _keys(ip):
+        value = ip_to_int(ip)
+        return (24, value >> 8), (16, value >> 16)
+
+    def observe(self, ip, rtt):
+        """Records the time it took `ip` to answer a connect (accepted or refused)."""
+        with self.lock:
+            for key in self._keys(ip):
+                samples = self.samples.get(key)
+                if samples is None:
+                    samples = self.samples[key] = deque(maxlen=self.window)
+                samples.append(rtt)
+                self.estimates.pop(key, None)
+
+    def _estimate(self, key):
+        estimate = self.estimates.get(key)
+        if estimate is not None:
+            return estimate
+        samples = self.samples.get(key)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        rtt = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+        estimate = min(self.ceiling, max(self.floor, rtt * self.multiplier + self.margin))
+        self.estimates[key] = estimate
+        return estimate
+
+    def timeout(self, ip):
+        """Returns the connect timeout to use for `ip`."""
+        with self.lock:
+            for key in self._keys(ip):
+                estimate = self._estimate(key)
+                if estimate is not None:
+                    return estimate
+        return self.default
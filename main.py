@@ -1,61 +1,355 @@
-import concurrent.futures
+import argparse
+import asyncio
+import errno
+import multiprocessing
+import queue
 import socket
-import subprocess
 import logging
-import ipaddress
 import signal
 import os
 import time
-import sys
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
+from hakotx.checkpoint import Checkpoint, intervals_to_ips, ips_to_intervals
+from hakotx.concurrency import AIMDController
+from hakotx.density import load_density_plan, sample_block
+from hakotx.files import write_atomic
+from hakotx.hoststate import HostBitmap, PresenceHistory
+from hakotx.hoststore import FINGERPRINT_TTL, HostStore
+from hakotx.ledger import FailureLedger
+from hakotx.ports import load_sweep_ports, save_open_ports
+from hakotx.ranges import int_to_ip, ip_to_int, load_host_range
+from hakotx.rawhttp import HTTP_PORT, fetch_on_socket
+from hakotx.timeouts import AdaptiveTimeout
 
 logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
 
 stop_script = False
 
+SWEEP_PORTS = load_sweep_ports()
+CONNECT_TIMEOUT = 2
+MAX_CONCURRENCY = 2000
+SHARDS_PER_PROCESS = 4
+PROGRESS_BATCH = 256
+SWEEP_CHECKPOINT = "ips/.sweep_checkpoint.json"
+HISTORY_RUNS_FOR_DENSITY = 7
+FETCH_TIMEOUT = 4
+
+connect_timeouts = AdaptiveTimeout(CONNECT_TIMEOUT)
+
+# Local resource exhaustion means too many connects are in flight; timeouts and
+# unreachable hosts are just dead address space and carry no signal
+CONGESTION_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.EADDRNOTAVAIL, errno.EAGAIN}
+
+# Set inside shard worker processes, see _init_shard_worker
+_stop_event = None
+_progress_queue = None
+
 def signal_handler(sig, frame):
     global stop_script
     logging.info("Signal received, stopping the script...")
     stop_script = True
 
-def check_ip(ip):
-    """Checks if the specified IP address is alive."""
-    if stop_script:
-        return ip, False
+def stopping():
+    """Returns True once a stop was requested in this process or by the parent process."""
+    return stop_script or (_stop_event is not None and _stop_event.is_set())
+
+async def probe_port(ip, port, timeout=None, controller=None, on_response=None):
+    """Tries one non-blocking connect and returns whether it was accepted.
+
+    Without an explicit timeout the per-subnet estimate from connect_timeouts is used.
+    Refused connects count as an answer for the RTT estimate but not as open.
+    With on_response, an accepted connect to the HTTP port is reused to fetch the
+    landing page and on_response(ip, response) gets the RawResponse, or None.
+    """
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    started = time.monotonic()
+    outcome = None
     try:
-        socket.setdefaulttimeout(2)
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((ip, 80))
-        return ip, True
-    except (socket.timeout, ConnectionRefusedError, socket.error) as e:
-        logging.debug(f"IP {ip} check failed: {e}")
-        return ip, False
-
-def process_ip_range(ip_range):
-    """Processes a range of IP addresses and returns lists of alive and dead IPs."""
-    alive_ips = []
-    dead_ips = []
+        await asyncio.wait_for(loop.sock_connect(sock, (ip, port)),
+                               timeout or connect_timeouts.timeout(ip))
+        connect_timeouts.observe(ip, time.monotonic() - started)
+        outcome = True
+        if on_response is not None and port == HTTP_PORT:
+            on_response(ip, await fetch_on_socket(sock, ip, FETCH_TIMEOUT))
+        return True
+    except ConnectionRefusedError as e:
+        connect_timeouts.observe(ip, time.monotonic() - started)
+        outcome = True
+        logging.debug(f"IP {ip} port {port} check failed: {e!r}")
+        return False
+    except (asyncio.TimeoutError, OSError) as e:
+        if isinstance(e, ConnectionResetError) or getattr(e, "errno", None) in CONGESTION_ERRNOS:
+            outcome = False
+        logging.debug(f"IP {ip} port {port} check failed: {e!r}")
+        return False
+    finally:
+        sock.close()
+        if controller is not None:
+            controller.record(outcome)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
-        futures = {executor.submit(check_ip, ip): ip for ip in ip_range}
+async def probe_ip(ip, ports=None, timeout=None, controller=None, on_response=None):
+    """Probes all sweep ports of a host in one pass."""
+    ports = ports or SWEEP_PORTS
+    results = await asyncio.gather(*(probe_port(ip, port, timeout, controller, on_response) for port in ports))
+    return ip, tuple(port for port, is_open in zip(ports, results) if is_open)
 
-        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Checking IPs"):
-            if stop_script:
-                break
-            ip = futures[future]
+def open_file_budget():
+    """Descriptors the process can spend on connections, leaving some for files and the rest; None if unlimited."""
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, ValueError, OSError):
+        return None
+    if soft == resource.RLIM_INFINITY:
+        return None
+    return max(1, soft - 64)
+
+def effective_concurrency(concurrency, reserved=0):
+    """Caps the number of in-flight connects below the open file limit, less `reserved` descriptors used by other work in the process."""
+    budget = open_file_budget()
+    if budget is None:
+        return concurrency
+    limit = max(1, budget - reserved)
+    if concurrency > limit:
+        logging.warning(f"Concurrency {concurrency} exceeds the open file limit, using {limit}")
+        return limit
+    return concurrency
+
+async def sweep(ips, on_result, concurrency=MAX_CONCURRENCY, on_response=None):
+    """Probes every IP from the iterable, keeping at most `concurrency` connects in flight.
+
+    on_result(ip, open_ports) is called for every host; an empty open_ports means dead.
+    on_response is passed on to probe_port to fingerprint on the probing connection.
+
+    Within that ceiling an AIMD controller backs off when the local stack runs out
+    of sockets or ports and grows back while connects complete cleanly.
+    """
+    controller = AIMDController(concurrency, minimum=min(concurrency, 16), maximum=concurrency,
+                                latency_factor=None)
+    in_flight = set()
+
+    def drain(done):
+        for task in done:
             try:
-                ip, is_alive = future.result()
-                if is_alive:
-                    alive_ips.append(ip)
-                    logging.info(f"IP {ip} is alive")
-                else:
-                    dead_ips.append(ip)
-                    logging.info(f"IP {ip} is dead")
+                on_result(*task.result())
             except Exception as e:
-                logging.error(f"Error processing IP {ip}: {e}")
+                logging.error(f"Error processing IP: {e}")
+
+    for ip in ips:
+        if stopping():
+            break
+        while len(in_flight) * len(SWEEP_PORTS) >= controller.limit:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            drain(done)
+        in_flight.add(asyncio.ensure_future(probe_ip(ip, controller=controller, on_response=on_response)))
+
+    if in_flight:
+        done, _ = await asyncio.wait(in_flight)
+        drain(done)
+
+async def density_sweep(ip_range, on_result, concurrency, plan, on_response=None):
+    """Samples every /24 first, then sweeps the subnets that look populated, then the sparse rest.
+
+    A subnet counts as populated when its sample found a live host or when
+    plan.known_blocks says devices lived there before. With plan.skip_sparse
+    the remaining subnets are not swept at all.
+    """
+    populated = set(plan.known_blocks)
+
+    def record(ip, open_ports):
+        if open_ports:
+            populated.add(ip_to_int(ip) >> 8)
+        on_result(ip, open_ports)
+
+    def samples():
+        for block in ip_range.blocks():
+            for value in sample_block(ip_range.block_addresses(block), plan.sample_size):
+                yield int_to_ip(value)
+
+    def remainder(blocks):
+        for block in blocks:
+            addresses = ip_range.block_addresses(block)
+            sampled = set(sample_block(addresses, plan.sample_size))
+            for value in addresses:
+                if value not in sampled:
+                    yield int_to_ip(value)
+
+    await sweep(samples(), record, concurrency, on_response)
+    if stopping():
+        return
+
+    dense = [block for block in ip_range.blocks() if block in populated]
+    sparse = [block for block in ip_range.blocks() if block not in populated]
+    logging.info(f"{len(dense)} populated and {len(sparse)} sparse subnets after sampling")
+
+    await sweep(remainder(dense), record, concurrency, on_response)
+    if stopping():
+        return
+
+    if plan.skip_sparse:
+        logging.info(f"Skipping {len(sparse)} sparse subnets")
+    else:
+        await sweep(remainder(sparse), record, concurrency, on_response)
+
+def run_sweep(ip_range, on_result, concurrency, plan=None, on_response=None):
+    """Runs the linear or density-ordered sweep on a fresh event loop."""
+    if plan is None:
+        asyncio.run(sweep(ip_range, on_result, concurrency, on_response))
+    else:
+        asyncio.run(density_sweep(ip_range, on_result, concurrency, plan, on_response))
+
+def process_ip_range(ip_range, concurrency=MAX_CONCURRENCY, on_progress=None, plan=None, on_alive=None,
+                     on_response=None, reserved=0):
+    """Processes a range of IP addresses.
+
+    Returns the alive IPs as a dict of IP to open ports, and a list of dead IPs.
+    `reserved` descriptors of the open file budget are left to other work in
+    the process, such as the fingerprint stage.
+    on_progress(alive_ips, dead_ips) is called after every result, e.g. to checkpoint.
+    on_alive(ip, open_ports) is called as soon as a host is found alive.
+    """
+    alive_ips = {}
+    dead_ips = []
+    total = len(ip_range) if hasattr(ip_range, "__len__") else None
+
+    with tqdm(total=total, desc="Checking IPs") as progress:
+        def on_result(ip, open_ports):
+            if open_ports:
+                alive_ips[ip] = open_ports
+                logging.info(f"IP {ip} is alive on ports {open_ports}")
+                if on_alive is not None:
+                    on_alive(ip, open_ports)
+            else:
+                dead_ips.append(ip)
+                logging.info(f"IP {ip} is dead")
+            progress.update()
+            if on_progress is not None:
+                on_progress(alive_ips, dead_ips)
+
+        run_sweep(ip_range, on_result, effective_concurrency(concurrency, reserved), plan, on_response)
 
     return alive_ips, dead_ips
 
+def reserve_descriptors(controller):
+    """Caps an AIMDController at half the open file budget and returns the descriptors it may hold at once."""
+    budget = open_file_budget()
+    if budget is not None:
+        controller.cap(max(1, budget // 2))
+    return controller.maximum
+
+def _init_shard_worker(stop_event, progress_queue):
+    global _stop_event, _progress_queue
+    # The parent owns Ctrl-C handling and forwards it through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _stop_event = stop_event
+    _progress_queue = progress_queue
+
+def sweep_shard(shard, concurrency, plan=None, fetch=False):
+    """Sweeps one shard inside a worker process and returns its alive (with open ports) and dead IPs.
+
+    With fetch, landing pages read on the probing connections are sent to the parent with the progress.
+    """
+    alive_ips = {}
+    dead_ips = []
+    done = 0
+    found = []
+    responses = []
+
+    def on_result(ip, open_ports):
+        nonlocal done, found, responses
+        if open_ports:
+            alive_ips[ip] = open_ports
+            found.append((ip, open_ports))
+        else:
+            dead_ips.append(ip)
+        done += 1
+        if done >= PROGRESS_BATCH:
+            # Alive hosts travel with the progress count so the parent can hand them on right away
+            _progress_queue.put((done, found, responses))
+            done = 0
+            found = []
+            responses = []
+
+    def on_response(ip, response):
+        responses.append((ip, response))
+
+    run_sweep(shard, on_result, concurrency, plan, on_response if fetch else None)
+    if done:
+        _progress_queue.put((done, found, responses))
+    return alive_ips, dead_ips
+
+def process_ip_range_sharded(ip_range, processes, concurrency=MAX_CONCURRENCY, on_progress=None, plan=None,
+                             on_alive=None, on_response=None):
+    """Splits the range into shards swept by `processes` worker processes, each with its own event loop.
+
+    on_progress(alive_ips, dead_ips) is called whenever a shard completes.
+    on_alive(ip, open_ports) and on_response(ip, response) are called as the shards report progress.
+    """
+    shards = ip_range.split(processes * SHARDS_PER_PROCESS)
+    per_process = effective_concurrency(max(1, concurrency // processes))
+    shard_results = {}
+
+    def merged():
+        alive_ips = {}
+        dead_ips = []
+        for index in sorted(shard_results):
+            alive_ips.update(shard_results[index][0])
+            dead_ips.extend(shard_results[index][1])
+        return alive_ips, dead_ips
+
+    ctx = multiprocessing.get_context()
+    stop_event = ctx.Event()
+    progress_queue = ctx.Queue()
+
+    with tqdm(total=len(ip_range), desc="Checking IPs") as progress, ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=ctx,
+        initializer=_init_shard_worker,
+        initargs=(stop_event, progress_queue),
+    ) as executor:
+        future_to_index = {executor.submit(sweep_shard, shard, per_process, plan, on_response is not None): index
+                           for index, shard in enumerate(shards)}
+
+        def report(update):
+            done, found, responses = update
+            progress.update(done)
+            if on_response is not None:
+                for ip, response in responses:
+                    on_response(ip, response)
+            if on_alive is not None:
+                for ip, open_ports in found:
+                    on_alive(ip, open_ports)
+
+        pending = set(future_to_index)
+        while pending:
+            if stop_script:
+                stop_event.set()
+            try:
+                report(progress_queue.get(timeout=0.2))
+            except queue.Empty:
+                pass
+
+            for future in [future for future in pending if future.done()]:
+                pending.discard(future)
+                try:
+                    shard_results[future_to_index[future]] = future.result()
+                except Exception as e:
+                    logging.error(f"Error processing shard: {e}")
+                    continue
+                if on_progress is not None:
+                    on_progress(*merged())
+
+        while True:
+            try:
+                report(progress_queue.get_nowait())
+            except queue.Empty:
+                break
+
+    return merged()
+
 def ensure_files_exist():
     """Ensure that alive.txt and dead.txt files exist."""
     files = ["ips/alive.txt", "ips/dead.txt"]
@@ -68,50 +362,165 @@ def ensure_files_exist():
         except Exception as e:
             logging.error(f"Failed to create {file}: {e}")
 
-def main():
-    """Main function that processes a range of IP addresses and saves the results to files."""
-    ensure_files_exist()
-    
-    ip_range1 = [str(ip) for ip in ipaddress.IPv4Network('172.17.0.0/20')]
-    ip_range2 = [str(ip) for ip in ipaddress.IPv4Network('172.18.0.0/20')]
-    ip_range3 = [str(ip) for ip in ipaddress.IPv4Network('10.17.0.0/20')]
-    ip_range4 = [str(ip) for ip in ipaddress.IPv4Network('10.18.0.0/20')]
-
-    ip_range = ip_range1 + ip_range2 + ip_range3 + ip_range4
-
-    logging.info("Starting IP range processing.")
-    alive_ips, dead_ips = process_ip_range(ip_range)
-    
-    if stop_script:
-        logging.info("Script stopped before completion.")
-        return
-
+def save_sweep_results(alive_ips, dead_ips):
+    """Writes the sweep results to ips/alive.txt and ips/dead.txt."""
     try:
-        with open("ips/alive.txt", "w") as alive_file:
-            alive_file.write("\n".join(alive_ips))
+        write_atomic("ips/alive.txt", "\n".join(alive_ips))
         logging.info("Alive IPs saved to alive.txt.")
     except Exception as e:
         logging.error(f"Failed to save alive IPs: {e}")
 
     try:
-        with open("ips/dead.txt", "w") as dead_file:
-            dead_file.write("\n".join(dead_ips))
+        write_atomic("ips/dead.txt", "\n".join(dead_ips))
         logging.info("Dead IPs saved to dead.txt.")
     except Exception as e:
         logging.error(f"Failed to save dead IPs: {e}")
 
-    # Preparation
+def record_presence(history, alive_ips):
+    """Diffs this run against the previous one, writes ips/new.txt and ips/vanished.txt and extends the history."""
+    current = HostBitmap.from_ips(history.host_range, alive_ips)
+    previous = history.latest()
+    if previous is not None:
+        new_hosts = current.new_since(previous)
+        vanished_hosts = current.vanished_since(previous)
+        logging.info(f"{len(new_hosts)} new and {len(vanished_hosts)} vanished hosts since the last run")
+        for path, hosts in (("ips/new.txt", new_hosts), ("ips/vanished.txt", vanished_hosts)):
+            try:
+                write_atomic(path, "\n".join(hosts))
+            except OSError as e:
+                logging.error(f"Failed to save {path}: {e}")
+
+    history.append(current)
+    history.save()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweep the configured ranges for live ONUs.")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of worker processes to shard the sweep across (default: 1)")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY,
+                        help=f"total connects kept in flight (default: {MAX_CONCURRENCY})")
+    parser.add_argument("--inline-fingerprint", action="store_true",
+                        help="fetch the landing page on the connection that found the host alive")
+    parser.add_argument("--full-fingerprint", action="store_true",
+                        help="fingerprint every alive host, not only new and changed ones")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its checkpoint")
+    return parser.parse_args()
+
+def main(args):
+    """Main function that processes a range of IP addresses and saves the results to files.
+
+    Alive hosts are fingerprinted while the sweep is still running.
+    """
+    # Imported here so this script's logging setup applies to both
+    import clean
+    import sep
+
+    ensure_files_exist()
+    
+    host_range = load_host_range()
+    ip_range = host_range
+    history = PresenceHistory(host_range)
     try:
-        subprocess.run([sys.executable, "clean.py"], check=True)
-        time.sleep(2)
-        subprocess.run([sys.executable, "sep.py"], check=True)
-        logging.info("Subprocesses completed successfully.")
-        time.sleep(2)
-        
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Subprocess failed: {e}")
+        with open("ips/alive.txt", "r") as alive_file:
+            previous_alive = alive_file.read().splitlines()
+    except OSError:
+        previous_alive = []
+    previous_alive += list(history.recent_union(HISTORY_RUNS_FOR_DENSITY))
+    checkpoint = Checkpoint(SWEEP_CHECKPOINT, host_range.key())
+    prior_alive = {}
+    prior_dead = []
+    prior_fingerprints = None
+    sweep_complete = False
+
+    if args.resume and checkpoint.load():
+        prior_alive = checkpoint.state.get("alive", {})
+        prior_dead = intervals_to_ips(checkpoint.state.get("dead", []))
+        prior_fingerprints = checkpoint.state.get("fingerprints")
+        sweep_complete = checkpoint.state.get("complete", False)
+        ip_range = ip_range.excluding(ips_to_intervals(list(prior_alive) + prior_dead))
+        logging.info(f"Resuming sweep with {len(prior_alive) + len(prior_dead)} addresses already checked.")
+
+    store = HostStore()
+    fingerprints = sep.FingerprintStage(prior_fingerprints, store, 0 if args.full_fingerprint else FINGERPRINT_TTL,
+                                        FailureLedger(store, sep.FINGERPRINT_STAGE, enforce=not args.full_fingerprint))
+
+    # The fingerprint stage connects from this process too, so its share of the descriptors is not the sweep's
+    reserved = reserve_descriptors(sep.fingerprint_concurrency)
+
+    def on_alive(ip, open_ports):
+        # Hosts alive on other ports only have nothing to fingerprint
+        if HTTP_PORT in open_ports or HTTP_PORT not in SWEEP_PORTS:
+            fingerprints.submit(ip, open_ports)
+
+    def on_response(ip, response):
+        # Hosts without a usable response here are fingerprinted over a new connection by on_alive
+        fingerprints.record(ip, sep.check_raw_response(ip, response))
+
+    for ip, open_ports in prior_alive.items():
+        on_alive(ip, open_ports)
+
+    def sweep_state(alive_ips, dead_ips, complete=False):
+        return {
+            "alive": {**prior_alive, **alive_ips},
+            "dead": ips_to_intervals(prior_dead + dead_ips),
+            "complete": complete,
+            "fingerprints": fingerprints.state(),
+        }
+
+    def on_progress(alive_ips, dead_ips):
+        checkpoint.maybe_save(lambda: sweep_state(alive_ips, dead_ips))
+
+    alive_ips = {}
+    dead_ips = []
+    if not sweep_complete:
+        logging.info("Starting IP range processing.")
+        plan = load_density_plan(previous_alive + list(prior_alive))
+        inline = on_response if args.inline_fingerprint else None
+        if args.processes > 1:
+            alive_ips, dead_ips = process_ip_range_sharded(ip_range, args.processes, args.concurrency,
+                                                           on_progress, plan, on_alive, inline)
+        else:
+            alive_ips, dead_ips = process_ip_range(ip_range, args.concurrency, on_progress, plan, on_alive, inline,
+                                                   reserved)
+
+    if stop_script:
+        # In-flight probes have been drained, so everything recorded so far is final
+        fingerprints.cancel()
+        store.close()
+        checkpoint.state = sweep_state(alive_ips, dead_ips)
+        checkpoint.save()
+        logging.info("Script stopped before completion, run with --resume to continue.")
+        return
+
+    checkpoint.state = sweep_state(alive_ips, dead_ips, complete=True)
+    checkpoint.save()
+    all_alive = {**prior_alive, **alive_ips}
+    save_sweep_results(list(all_alive), prior_dead + dead_ips)
+    save_open_ports(all_alive, SWEEP_PORTS)
+    record_presence(history, all_alive)
+    store.touch(all_alive)
+
+    # Preparation
+    clean.main()
+
+    logging.info("Sweep finished, waiting for the remaining fingerprints.")
+    while not fingerprints.wait(timeout=1):
+        if stop_script:
+            fingerprints.cancel()
+            store.close()
+            checkpoint.state = sweep_state(alive_ips, dead_ips, complete=True)
+            checkpoint.save()
+            logging.info("Script stopped before completion, run with --resume to continue.")
+            return
+        checkpoint.maybe_save(lambda: sweep_state(alive_ips, dead_ips, complete=True))
+
+    fingerprints.save()
+    store.close()
+    logging.info(f"{fingerprints.cached} hosts kept their stored classification.")
+    checkpoint.clear()
 
 if __name__ == "__main__":
     signal.signal(signal.SIGINT, signal_handler)
-    main()
+    main(parse_args())
     logging.info("Done!")
\ No newline at end of file
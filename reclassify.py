@@ -0,0 +1,123 @@
+import argparse
+import logging
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+import sep
+from hakotx.files import read_lines
+from hakotx.hoststore import HOST_STORE, HostStore
+from hakotx.pagematch import HEAD_BYTES, evidence_is_complete, extract_title, match_evidence
+from hakotx.signatures import LEARNED_FILE, SIGNATURES_FILE, load_signatures, save_learned_rules
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def reclassify(store, registry):
+    """Re-runs the registry over the stored evidence; returns {ip: (old type, new type)} for hosts that changed.
+
+    A host whose evidence matches nothing only becomes unknown when the
+    evidence holds its whole page; otherwise it keeps its stored type.
+    """
+    changes = {}
+    for ip, ip_type, evidence, page_md5 in store.evidence():
+        signature = match_evidence(registry, evidence, page_md5)
+        if signature is None and ip_type is not None and not evidence_is_complete(evidence, page_md5):
+            continue
+        new_type = signature.type if signature is not None else "unknown"
+        if new_type != ip_type:
+            changes[ip] = (ip_type, new_type)
+    return changes
+
+def _decided_by_page(registry, ip_type, evidence, page_md5):
+    """Whether the stored page hash or markers of a host point at its type in `registry`."""
+    indexes = {registry.markers[marker] for marker in evidence.markers if marker in registry.markers}
+    if page_md5 in registry.by_md5:
+        indexes.add(registry.by_md5[page_md5])
+    return any(registry[index].type == ip_type for index in indexes)
+
+def learn_rules(store, registry, min_hosts=3):
+    """Derives cheap-tier rules from the stored evidence of classified hosts.
+
+    Only hosts whose type the page hash or markers of `registry` account for
+    teach a rule, so rules are not learned from hosts the cheap tier itself
+    typed. A Server header, URL path or title becomes a rule for a type when
+    at least `min_hosts` such hosts show it and every host showing it,
+    unknown ones included, has that type. Returns {type: {kind: [values]}}.
+    """
+    seen = defaultdict(Counter)
+    for ip, ip_type, evidence, page_md5 in store.evidence():
+        if ip_type is None:
+            continue
+        if ip_type != "unknown" and not _decided_by_page(registry, ip_type, evidence, page_md5):
+            continue
+        path = urlsplit(evidence.url or "/").path
+        values = {
+            "server": evidence.headers.get("server"),
+            "path": path if path not in ("", "/") else None,
+            "title": extract_title(evidence.body_prefix[:HEAD_BYTES], evidence.encoding) or None,
+        }
+        for kind, value in values.items():
+            if value:
+                seen[kind, value][ip_type] += 1
+
+    rules = defaultdict(lambda: defaultdict(list))
+    for (kind, value), types in sorted(seen.items()):
+        if len(types) != 1:
+            continue
+        (ip_type, count), = types.items()
+        if ip_type != "unknown" and count >= min_hosts:
+            rules[ip_type][kind].append(value)
+    return rules
+
+def update_lists(changes, ip_types):
+    """Moves the changed hosts between the ips/<type>.txt files written by the last run."""
+    ip_results = {ip_type: [] for ip_type in ip_types}
+    for ip_type in ip_types:
+        for ip in read_lines(f"ips/{ip_type}.txt"):
+            new_type = changes.get(ip, (None, ip_type))[1]
+            ip_results.setdefault(new_type, []).append(ip)
+    sep.save_results(ip_results, read_lines("ips/sep_failed.txt"))
+
+def main(args):
+    store = HostStore(args.store)
+    if args.learn:
+        # Learned rules are left out, only hashes and markers vouch for a type
+        rules = learn_rules(store, load_signatures(args.signatures, None), args.min_hosts)
+        for ip_type, kinds in sorted(rules.items()):
+            for kind, values in kinds.items():
+                logging.info(f"{ip_type}: {kind} {', '.join(repr(value) for value in values)}")
+        if not args.dry_run:
+            save_learned_rules(rules, args.learned)
+            logging.info(f"Cheap-tier rules for {len(rules)} types saved to {args.learned}")
+        store.close()
+        return
+
+    registry = load_signatures(args.signatures, args.learned)
+    changes = reclassify(store, registry)
+
+    for (old_type, new_type), count in sorted(Counter(changes.values()).items(), key=str):
+        logging.info(f"{count} hosts {old_type} -> {new_type}")
+    logging.info(f"{len(changes)} hosts reclassified")
+
+    if not args.dry_run and changes:
+        for ip, (_, new_type) in changes.items():
+            store.set_type(ip, new_type)
+        update_lists(changes, list(dict.fromkeys(sep.IP_TYPES + registry.types() + ["unknown"])))
+    store.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Re-run the device signatures over the evidence stored by the last checks, without network traffic.")
+    parser.add_argument("--signatures", default=SIGNATURES_FILE,
+                        help="signature registry to apply (default: signatures.properties)")
+    parser.add_argument("--store", default=HOST_STORE, help=f"host store to read (default: {HOST_STORE})")
+    parser.add_argument("--learned", default=LEARNED_FILE,
+                        help="cheap-tier rules file (default: signatures.learned.properties)")
+    parser.add_argument("--learn", action="store_true",
+                        help="derive Server header, URL path and title rules from the evidence instead")
+    parser.add_argument("--min-hosts", type=int, default=3,
+                        help="hosts that must agree before a value becomes a rule (default: 3)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -1,4 +1,5 @@
 import os
+import sys
 import csv
 import logging
 from concurrent.futures import ThreadPoolExecutor
@@ -6,6 +7,10 @@ from dotenv import load_dotenv
 import telnetlib
 import configparser
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from hakotx.concurrency import AIMDController
+from hakotx.ports import OpenPorts
+
 load_dotenv()
 
 username = os.getenv("LUCI_USERNAME")
@@ -91,6 +96,8 @@ def process_ip(ip_address):
         command_output = execute_command(tn, "uci export")
         save_configuration(ip_address, command_output)
         tn.close()
+        return True
+    return False
 
 def tocsv():
     file_names = os.listdir(LUCI_CONF_FOLDER)
@@ -128,10 +135,14 @@ def main():
     with open("./ips/AR9331.txt", "r") as file:
         ip_addresses = file.read().splitlines()
 
+    # Skip units the sweep found without telnet instead of waiting out the login timeout
+    ip_addresses = OpenPorts().filter(ip_addresses, 23)
+
     os.makedirs(LUCI_CONF_FOLDER, exist_ok=True)
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        list(executor.map(process_ip, ip_addresses))
+    controller = AIMDController(10)
+    with ThreadPoolExecutor(max_workers=controller.maximum) as executor:
+        list(executor.map(lambda ip: controller.call(process_ip, ip, is_failure=lambda ok: not ok), ip_addresses))
 
     tocsv()
 
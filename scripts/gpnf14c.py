@@ -1,11 +1,14 @@
 import os
-import requests
+import sys
 import logging
 import csv
 import configparser
-from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from hakotx.collect import Driver, run_drivers, script_args
+from hakotx.rawhttp import FetchError
+
 # Load environment variables
 load_dotenv()
 
@@ -34,80 +37,61 @@ def ensure_directories():
         logging.error(f"Failed to create directory {XML_DIRECTORY}: {str(e)}")
         raise
 
-def login_and_download(ip):
-    """Login to device and download configuration."""
-    session = requests.Session()
-    
-    # Headers for login
-    login_headers = {
-        "Accept": "*/*",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Connection": "keep-alive",
-        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-        "Origin": f"http://{ip}",
-        "Referer": f"http://{ip}/login.asp",
-        "X-Requested-With": "XMLHttpRequest"
-    }
-    
-    # Headers for config download
-    download_headers = {
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Cache-Control": "max-age=0",
-        "Connection": "keep-alive",
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Origin": f"http://{ip}",
-        "Referer": f"http://{ip}/page/config.asp?0",
-        "Upgrade-Insecure-Requests": "1"
-    }
-    
-    try:
-        # Login request
-        login_url = f"http://{ip}/boaform/webLogin"
+class GPNF14CDriver(Driver):
+    name = "GPNF14C"
+    types = ("GPNF14C",)
+    folder = XML_DIRECTORY
+    timeout = 5
+
+    async def login(self, session, ip):
+        """Logs in on the device's session; the session cookie carries over to the download."""
+        login_headers = {
+            "Accept": "*/*",
+            "Accept-Language": "en-US,en;q=0.9",
+            "Connection": "keep-alive",
+            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+            "Origin": f"http://{ip}",
+            "Referer": f"http://{ip}/login.asp",
+            "X-Requested-With": "XMLHttpRequest"
+        }
         login_data = {
             "username": USERNAME,
             "password": PASSWORD,
             "language": "0"
         }
-        
-        login_response = session.post(
-            login_url, 
-            headers=login_headers, 
-            data=login_data,
-            verify=False,
-            timeout=5
-        )
-        
-        if login_response.status_code != 200:
-            logging.error(f"Login failed for {ip}: {login_response.status_code}")
-            return False
-            
-        # Download configuration
-        download_url = f"http://{ip}/boaform/settingConfig"
+        login_response = await session.post(f"http://{ip}/boaform/webLogin", login_data, headers=login_headers)
+        if login_response.status != 200:
+            raise FetchError(f"Login failed for {ip}: {login_response.status}")
+
+    async def fetch(self, session, ip, token):
+        """Downloads the configuration backup."""
+        download_headers = {
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.9",
+            "Cache-Control": "max-age=0",
+            "Connection": "keep-alive",
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Origin": f"http://{ip}",
+            "Referer": f"http://{ip}/page/config.asp?0",
+            "Upgrade-Insecure-Requests": "1"
+        }
         download_data = {"config_backup": "Backup"}
-        
-        download_response = session.post(
-            download_url,
-            headers=download_headers,
-            data=download_data,
-            verify=False,
-            timeout=5
-        )
-        
-        if download_response.status_code == 200:
-            # Save the configuration
-            config_file = os.path.join(XML_DIRECTORY, f"{ip}.xml")
-            with open(config_file, "wb") as f:
-                f.write(download_response.content)
-            logging.info(f"Successfully downloaded configuration for {ip}")
-            return True
+        download_response = await session.post(f"http://{ip}/boaform/settingConfig", download_data,
+                                               headers=download_headers)
+        if download_response.status != 200:
+            raise FetchError(f"Download failed for {ip}: {download_response.status}")
+        logging.info(f"Successfully downloaded configuration for {ip}")
+        return download_response.body
+
+    def extract(self, collected):
+        """Parse configurations and save to CSV."""
+        logging.info("Starting XML parsing...")
+        results = parse_xml_files()
+        if results:
+            save_to_csv(results)
+            logging.info("XML parsing and CSV generation completed")
         else:
-            logging.error(f"Download failed for {ip}: {download_response.status_code}")
-            return False
-            
-    except Exception as e:
-        logging.error(f"Error processing {ip}: {str(e)}")
-        return False
+            logging.warning("No valid configurations found to parse")
 
 def normalize_mac(mac):
     """Normalize MAC address to uppercase with colons."""
@@ -178,42 +162,12 @@ def save_to_csv(data):
     except Exception as e:
         logging.error(f"Failed to save CSV: {str(e)}")
 
-def main():
+DRIVER = GPNF14CDriver()
+
+def main(full=False):
     """Main function to process IPs from file."""
     ensure_directories()
-    
-    try:
-        with open("./ips/gpnf14c.txt", "r") as f:
-            ip_list = [ip.strip() for ip in f.readlines()]
-    except FileNotFoundError:
-        logging.error("gpnf14c.txt not found")
-        return
-    
-    failed_ips = []
-    
-    # Download configurations
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        for ip in ip_list:
-            try:
-                if not login_and_download(ip):
-                    failed_ips.append(ip)
-            except Exception as e:
-                logging.error(f"Failed to process {ip}: {str(e)}")
-                failed_ips.append(ip)
-    
-    if failed_ips:
-        logging.info("Failed downloads:")
-        for ip in failed_ips:
-            logging.info(f"- {ip}")
-    
-    # Parse configurations and save to CSV
-    logging.info("Starting XML parsing...")
-    results = parse_xml_files()
-    if results:
-        save_to_csv(results)
-        logging.info("XML parsing and CSV generation completed")
-    else:
-        logging.warning("No valid configurations found to parse")
+    run_drivers([DRIVER], full=full)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(script_args(DRIVER).full)
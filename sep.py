@@ -1,122 +1,491 @@
-import requests
+import asyncio
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import ipaddress
+import signal
+import sys
+import threading
+import time
+import argparse
 import hashlib
+from collections import namedtuple
+from urllib.parse import urlsplit
+from hakotx.checkpoint import Checkpoint
+from hakotx.concurrency import AIMDController
+from hakotx.files import write_atomic
+from hakotx.hoststore import FINGERPRINT_TTL, Evidence, HostStore
+from hakotx.ledger import FailureLedger
+from hakotx.pagematch import CheapMatch, PageMatcher
+from hakotx.politeness import PolitenessLimiter, load_politeness
+from hakotx.ports import OpenPorts
+from hakotx.ranges import ip_to_int
+from hakotx.rawhttp import HTTP_PORT, FetchError, encoding_from_headers, open_page
+from hakotx.signatures import load_signatures
+from hakotx.timeouts import AdaptiveTimeout
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def check_ip(ip, timeout=4):
-    ip = ip.strip()
-    url = f"http://{ip}"
+# Connect timeouts are learned per subnet; the read timeout stays fixed so slow pages still load
+connect_timeouts = AdaptiveTimeout(4)
+
+# Requests kept in flight by the asyncio engine; connect timeouts, resets and
+# running out of local resources count as congestion, any completed HTTP
+# exchange as success, and hosts that do not speak HTTP carry no signal
+fingerprint_concurrency = AIMDController(100, minimum=15, maximum=800)
+
+# Caps per device and per /24 that hold however high the concurrency above grows
+POLITENESS = load_politeness()
+
+SEP_CHECKPOINT = "ips/.sep_checkpoint.json"
+
+# Stage of the failures ledger in the host store
+FINGERPRINT_STAGE = "fingerprint"
+
+stop_script = False
+
+def signal_handler(sig, frame):
+    global stop_script
+    logging.info("Signal received, stopping the script...")
+    stop_script = True
+
+# Device signatures from signatures.properties, checked in file order
+SIGNATURES = load_signatures()
+
+CHUNK_SIZE = 4096
+
+# Kept per host for offline reclassification (see reclassify.py)
+EVIDENCE_BYTES = 8192
+EVIDENCE_HEADERS = ("server", "content-type", "content-length", "www-authenticate", "set-cookie",
+                    "last-modified", "etag")
 
+# md5 is the hash of the whole page, None when it was not read to the end
+Fingerprint = namedtuple("Fingerprint", ["type", "ip", "md5", "evidence"], defaults=(None, None))
+
+def _evidence(url, status_line, headers, encoding, prefix, size, markers=()):
+    return Evidence(url, status_line, {name: headers[name] for name in EVIDENCE_HEADERS if name in headers},
+                    encoding, bytes(prefix[:EVIDENCE_BYTES]), size, tuple(sorted(markers)))
+
+async def check_ip(ip, timeout=4, on_headers=None, controller=None):
+    """Fetches the landing page of the IP in chunks and classifies it, stopping as soon as the match is certain.
+
+    on_headers(ip, headers) is called once the response headers are in, also
+    for responses that are not classified, such as HTTP errors. Returns None
+    when the host fails; raises FetchError when this machine ran out of
+    descriptors or buffers before reaching it, which says nothing about it.
+    The outcome is fed to `controller` (an AIMDController), if given.
+    """
+    ip = ip.strip()
+    started = time.monotonic()
+    outcome = None
     try:
-        response = requests.get(url, timeout=timeout)
-        response_hash = hashlib.md5(response.text.encode()).hexdigest()
-        response.raise_for_status()
-        
-    except requests.exceptions.RequestException as e:
+        result = await _check_page(ip, timeout, on_headers)
+        outcome = True
+        return result
+    except FetchError as e:
+        if e.congestion:
+            outcome = False
+        if e.local:
+            raise
         logging.info(f"IP {ip} failed to respond within the timeout: {e}")
         return None
-    
-    if "e474ea77307d75a23761377527e50bb4" in response_hash:
-        logging.info(f"IP {ip} is SPU-GE22WD-H")
-        return "SPU-GE22WD-H", ip
-
-    elif "Copyright (c) Realtek Semiconductor Corp., 2003. All Rights Reserved." in response.text:
-        logging.info(f"IP {ip} is Realtek GPON")
-        return "realtek", ip
-
-    elif "add by runt for bug#0001004 on 20190404" in response.text or "/* Added by peichao for mission#0007440 */" in response.text:
-        logging.info(f"IP {ip} is Uniway")
-        return "uniway", ip
-
-    elif "58c428178693963ffbae98857bb5f263" in response_hash:
-        logging.info(f"IP {ip} is ONU4FER1TVASWB")
-        return "ONU4FER1TVASWB", ip
-    
-    elif "b03c4b0b71167fb988046e201a23b8b7" in response_hash:
-        logging.info(f"IP {ip} is SPU-GE120W-H")
-        return "SPU-GE120W-H", ip
-
-    elif "df1d6d405702aa678f0ef3cf80105874" in response_hash:
-        logging.info(f"IP {ip} is KingType(PN_BH2_03-02)")
-        return "PN_BH2_03-02", ip
-
-    elif "16330cbd9f45bbe158679410ede94156" in response_hash:
-        logging.info(f"IP {ip} is KingType(XPN_RH2_00-07)")
-        return "XPN_RH2_00-07", ip
-
-    elif "b55993cb73060a58d829dc134ca2be09" in response_hash:
-        logging.info(f"IP {ip} is KingType(AR9331)")
-        return "AR9331", ip
-    
-    elif "82fc2f1160692df5c19a127728037f47" in response_hash: 
-        logging.info(f"IP {ip} is KingType(GPNF14C)")
-        return "GPNF14C", ip
-
-    else:
-        logging.info(f"IP {ip} is Unknown")
-        return "unknown", ip
+    finally:
+        if controller is not None:
+            controller.record(outcome, time.monotonic() - started if outcome else None)
 
-def main():
-    # Read IP list from file
+async def _check_page(ip, timeout, on_headers):
+    # Returns None for HTTP errors, which are a completed exchange all the same
+    page = await open_page(ip, connect_timeout=connect_timeouts.timeout(ip), timeout=timeout)
     try:
-        with open("ips/alive.txt", "r") as file:
-            ip_list = file.read().splitlines()
-    except Exception as e:
-        logging.error(f"Error reading IP list from file: {e}")
-        return
+        # Time to the response headers bounds the connect RTT from above
+        connect_timeouts.observe(ip, page.elapsed)
+        if on_headers is not None:
+            on_headers(ip, page.headers)
+        if page.status >= 400:
+            logging.info(f"IP {ip} answered with HTTP {page.status}")
+            return None
 
-    # Create a ThreadPoolExecutor
-    with ThreadPoolExecutor(max_workers=15) as executor:
-        future_to_ip = {executor.submit(check_ip, ip): ip for ip in ip_list}
-
-        # Create lists to store results for each IP type
-        ip_results = {
-            "uniway": [],
-            "realtek": [],
-            "ONU4FER1TVASWB": [],
-            "PN_BH2_03-02": [],
-            "SPU-GE22WD-H": [],
-            "XPN_RH2_00-07": [],
-            "AR9331": [],
-            "GPNF14C": [],
-            "SPU-GE120W-H": [],
-            "unknown": [],
-        }
-        failed_ips = []
-
-        # Collect the results and populate the respective IP lists
-        for future in as_completed(future_to_ip):
-            try:
-                result = future.result()
-                if result is not None:
-                    ip_type, ip = result
-                    ip_results[ip_type].append(ip)
-                else:
-                    failed_ips.append(future_to_ip[future])
-            except Exception as e:
-                logging.error(f"Error processing IP {future_to_ip[future]}: {e}")
+        matcher = PageMatcher(SIGNATURES, page.encoding)
+        prefix = bytearray()
+        complete = True
+        # Server header, URL and title first; the body is only read on when they are ambiguous
+        cheap = CheapMatch(SIGNATURES, page.headers.get("server"), urlsplit(page.url).path, page.encoding)
+        signature = cheap.decide()
+        if signature is None:
+            async for chunk in page.chunks(CHUNK_SIZE):
+                if len(prefix) < EVIDENCE_BYTES:
+                    prefix += chunk[:EVIDENCE_BYTES - len(prefix)]
+                if matcher.feed(chunk) is not None or matcher.truncated:
+                    complete = False
+                    break
+                signature = cheap.feed(chunk)
+                if signature is not None:
+                    complete = False
+                    break
+        else:
+            complete = False
+    finally:
+        page.close()
+
+    if signature is None:
+        signature = matcher.result(cheap.index)
+    evidence = _evidence(page.url, page.status_line, page.headers, page.encoding, prefix, matcher.size,
+                         matcher.markers)
+    return report(ip, signature, matcher.digest if complete else None, evidence)
+
+def check_raw_response(ip, response):
+    """Classifies a response read on the sweep's own connection (see hakotx.rawhttp).
+
+    Returns None when it cannot stand in for check_ip, e.g. for a redirect that requests would follow.
+    """
+    if response is None or response.status >= 300:
+        return None
+    # The same tiers and decoder as check_ip, so both paths classify a page alike
+    encoding = encoding_from_headers(response.headers)
+    matcher = PageMatcher(SIGNATURES, encoding)
+    cheap = CheapMatch(SIGNATURES, response.headers.get("server"), "/", encoding)
+    md5 = None
+    signature = cheap.decide()
+    if signature is None:
+        signature = matcher.feed(response.body) or cheap.feed(response.body)
+    if signature is None:
+        signature = matcher.result(cheap.index)
+        md5 = matcher.digest
+    return report(ip, signature, md5,
+                  _evidence(f"http://{ip}/", f"HTTP/1.1 {response.status}", response.headers, encoding,
+                            response.body, matcher.size, matcher.markers))
+
+def report(ip, signature, md5=None, evidence=None):
+    if signature is None:
+        logging.info(f"IP {ip} is Unknown")
+        return Fingerprint("unknown", ip, md5, evidence)
+    logging.info(f"IP {ip} is {signature.name}")
+    return Fingerprint(signature.type, ip, md5, evidence)
 
+IP_TYPES = SIGNATURES.types() + ["unknown"]
+
+def save_results(ip_results, failed_ips):
+    """Sorts the classified and failed IPs and writes them to ips/<type>.txt and ips/sep_failed.txt."""
     # Sort IP addresses in each category and save results to files
     for ip_type, ips in ip_results.items():
         try:
-            sorted_ips = sorted(ips, key=lambda ip: int(ipaddress.IPv4Address(ip)))
-            with open(f"ips/{ip_type}.txt", "w") as file:
-                file.write("\n".join(sorted_ips))
+            sorted_ips = sorted(ips, key=ip_to_int)
+            write_atomic(f"ips/{ip_type}.txt", "\n".join(sorted_ips))
             logging.info(f"Results for {ip_type} saved to {ip_type}.txt")
         except Exception as e:
             logging.error(f"Error saving results for {ip_type}: {e}")
 
     # Save failed IPs
     try:
-        sorted_failed = sorted(failed_ips, key=lambda ip: int(ipaddress.IPv4Address(ip)))
-        with open("ips/sep_failed.txt", "w") as file:
-            file.write("\n".join(sorted_failed))
+        sorted_failed = sorted(failed_ips, key=ip_to_int)
+        write_atomic("ips/sep_failed.txt", "\n".join(sorted_failed))
         logging.info("Failed IPs saved to sep_failed.txt")
     except Exception as e:
         logging.error(f"Error saving failed IPs: {e}")
 
+async def _timed_check(ip, limiter, on_headers=None):
+    async with limiter.slot(ip):
+        await limiter.pace(ip)
+        return await check_ip(ip, on_headers=on_headers, controller=fingerprint_concurrency)
+
+async def fingerprint_async(ips, on_result, stopping=lambda: stop_script, on_headers=None, on_unchecked=None):
+    """Runs check_ip over an async iterable of hosts, keeping fingerprint_concurrency.limit requests in flight.
+
+    on_result(ip, result) is called as each host completes; hosts not started
+    when stopping() turns true are skipped. on_headers is passed to check_ip.
+    on_unchecked(ip) is called instead for hosts that could not be tried for
+    lack of local resources, so they are not mistaken for failing hosts; by
+    default they go to on_result with None.
+    Hosts are started only once the PolitenessLimiter has a slot for them,
+    taking the /24s in turn, so the limit counts hosts being checked and a
+    higher one reaches more subnets rather than more hosts per subnet.
+    """
+    limiter = PolitenessLimiter(*POLITENESS)
+    in_flight = {}
+
+    def drain(done):
+        for task in done:
+            ip = in_flight.pop(task)
+            try:
+                try:
+                    result = task.result()
+                except FetchError as e:
+                    logging.warning(f"IP {ip} was not checked: {e}")
+                    if on_unchecked is not None:
+                        on_unchecked(ip)
+                        continue
+                    result = None
+                on_result(ip, result)
+            except Exception as e:
+                logging.error(f"Error processing IP {ip}: {e}")
+
+    async for ip in limiter.fair(ips):
+        if stopping():
+            break
+        while len(in_flight) >= fingerprint_concurrency.limit:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            drain(done)
+        in_flight[asyncio.ensure_future(_timed_check(ip, limiter, on_headers))] = ip
+
+    if in_flight:
+        done, _ = await asyncio.wait(in_flight)
+        drain(done)
+
+async def _iterate(ip_list):
+    for ip in ip_list:
+        yield ip
+
+def fingerprint_hosts(ip_list, store=None, open_ports=None):
+    """Fingerprints the hosts on a fresh event loop and returns [(ip, result)] in completion order.
+
+    With a HostStore every result is also recorded in `store`, with the
+    host's probe from `open_ports` ({ip: ports}), as are the Server headers.
+    """
+    results = []
+    open_ports = open_ports or {}
+
+    def on_result(ip, result):
+        if store is not None:
+            record_in_store(store, ip, result, HostStore.probe_of(open_ports.get(ip)))
+        results.append((ip, result))
+
+    on_headers = server_recorder(store) if store is not None else None
+    asyncio.run(fingerprint_async(_iterate(ip_list), on_result, on_headers=on_headers,
+                                  on_unchecked=lambda ip: results.append((ip, None))))
+    return results
+
+def record_in_store(store, ip, result, probe=None):
+    """Writes a check result, and the evidence it carries, to the HostStore."""
+    store.record_check(ip, result.type if result else None, result.md5 if result else None, probe)
+    if result is not None and result.evidence is not None:
+        store.record_evidence(ip, result.evidence, result.md5)
+        store.record_server(ip, result.evidence.headers.get("server"))
+
+def server_recorder(store):
+    """An on_headers hook keeping the Server header of every host that answers in the store, for vuln_checker.py."""
+    def on_headers(ip, headers):
+        store.record_server(ip, headers.get("server"))
+    return on_headers
+
+class FingerprintStage:
+    """Fingerprints hosts while the sweep that finds them is still running.
+
+    The asyncio engine runs on its own event loop in a background thread.
+    submit() only queues the host, so it can be called from the sweep's result
+    callback; wait() blocks until every submitted host has been classified.
+    Hosts already present in `state` (from a checkpoint) are not fingerprinted
+    again, nor are hosts the `store` classified within `ttl` seconds whose open
+    ports are unchanged. Hosts the `ledger` (a FailureLedger) holds back are
+    counted as failed without a request.
+    """
+
+    def __init__(self, state=None, store=None, ttl=FINGERPRINT_TTL, ledger=None):
+        state = state or {}
+        self.store = store
+        self.ttl = ttl
+        self.ledger = ledger
+        self.cached = 0
+        self._probes = {}
+        self.ip_results = {ip_type: list(state.get("results", {}).get(ip_type, [])) for ip_type in IP_TYPES}
+        self.failed_ips = list(state.get("failed", []))
+        self._seen = {ip for ips in self.ip_results.values() for ip in ips} | set(self.failed_ips)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._cancelled = False
+        self._loop = asyncio.new_event_loop()
+        self._queue = asyncio.Queue()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        try:
+            self._loop.run_until_complete(
+                fingerprint_async(self._hosts(), self._record_check, lambda: self._cancelled,
+                                  server_recorder(self.store) if self.store is not None else None,
+                                  self._record_unchecked))
+        finally:
+            # Page streams left early by check_ip are finalized here, as asyncio.run() would
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+
+    async def _hosts(self):
+        while True:
+            ip = await self._queue.get()
+            if ip is None:
+                return
+            yield ip
+
+    def submit(self, ip, open_ports=None):
+        ip = ip.strip()
+        if ip in self._seen:
+            return
+        self._seen.add(ip)
+        if self.store is not None:
+            probe = self._probes[ip] = HostStore.probe_of(open_ports)
+            ip_type = self.store.cached(ip, probe, self.ttl)
+            if ip_type is not None:
+                with self._lock:
+                    self.ip_results[ip_type].append(ip)
+                    self.cached += 1
+                return
+        if self.ledger is not None:
+            with self._lock:
+                if not self.ledger.admit(ip):
+                    self.failed_ips.append(ip)
+                    return
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, ip)
+
+    def record(self, ip, result, open_ports=None):
+        """Records a result obtained elsewhere, e.g. on the sweep's connection; None leaves the host to submit()."""
+        if result is None:
+            return
+        ip = ip.strip()
+        if ip in self._seen:
+            return
+        self._seen.add(ip)
+        self._probes[ip] = HostStore.probe_of(open_ports)
+        self._record_check(ip, result)
+
+    def _record_check(self, ip, result):
+        if self.store is not None:
+            record_in_store(self.store, ip, result, self._probes.get(ip))
+        with self._lock:
+            if self.ledger is not None:
+                self.ledger.record(ip, result is not None)
+            if result is not None:
+                self.ip_results[result.type].append(ip)
+            else:
+                self.failed_ips.append(ip)
+
+    def _record_unchecked(self, ip):
+        # Failed for this run, but neither the store nor the ledger hold it against the host
+        with self._lock:
+            self.failed_ips.append(ip)
+
+    def state(self):
+        with self._lock:
+            return {"results": {ip_type: list(ips) for ip_type, ips in self.ip_results.items()},
+                    "failed": list(self.failed_ips)}
+
+    def _close(self):
+        if not self._closed:
+            self._closed = True
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+
+    def wait(self, timeout=None):
+        """Returns True once every submitted host is done, False if some are still running after `timeout`.
+
+        No hosts can be submitted after the first call.
+        """
+        self._close()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def cancel(self):
+        """Drops the hosts that have not started yet and waits for the running ones."""
+        self._cancelled = True
+        self._close()
+        self._thread.join()
+
+    def save(self):
+        state = self.state()
+        save_results(state["results"], state["failed"])
+        if self.ledger is not None:
+            self.ledger.finish()
+        if self.store is not None:
+            self.store.commit()
+
+def main(resume=False, full=False, ttl=FINGERPRINT_TTL):
+    """Fingerprints the hosts in ips/alive.txt that the host store cannot vouch for.
+
+    With `full` every host is fingerprinted again, regardless of the store,
+    including hosts and subnets backing off after repeated failures.
+    """
+    # Read IP list from file
+    try:
+        with open("ips/alive.txt", "r") as file:
+            content = file.read()
+            ip_list = content.splitlines()
+    except Exception as e:
+        logging.error(f"Error reading IP list from file: {e}")
+        return
+
+    # Hosts the sweep found alive on other ports only have nothing to fingerprint
+    open_ports = OpenPorts()
+    ip_list = [ip.strip() for ip in open_ports.filter(ip_list, HTTP_PORT) if ip.strip()]
+    store = HostStore()
+    store.touch(ip_list)
+
+    # Create lists to store results for each IP type
+    ip_results = {ip_type: [] for ip_type in IP_TYPES}
+    failed_ips = []
+
+    # The checkpoint is only valid for the alive list it was taken against
+    checkpoint = Checkpoint(SEP_CHECKPOINT, hashlib.md5(content.encode()).hexdigest())
+    if resume and checkpoint.load():
+        for ip_type, ips in checkpoint.state.get("results", {}).items():
+            ip_results[ip_type].extend(ips)
+        failed_ips.extend(checkpoint.state.get("failed", []))
+        done = {ip for ips in ip_results.values() for ip in ips} | set(failed_ips)
+        ip_list = [ip for ip in ip_list if ip.strip() not in done]
+        logging.info(f"Resuming fingerprinting with {len(done)} hosts already classified")
+
+    def probe(ip):
+        return HostStore.probe_of(open_ports.ports.get(ip))
+
+    # Unchanged hosts checked within the TTL keep their stored classification,
+    # and hosts that keep failing stay failed until their backoff runs out
+    ledger = FailureLedger(store, FINGERPRINT_STAGE, enforce=not full)
+    to_check = []
+    for ip in ip_list:
+        ip_type = None if full else store.cached(ip, probe(ip), ttl)
+        if ip_type is not None:
+            ip_results[ip_type].append(ip)
+        elif not ledger.admit(ip):
+            failed_ips.append(ip)
+        else:
+            to_check.append(ip)
+    logging.info(f"{len(ip_list) - len(to_check) - ledger.skipped} hosts unchanged since their last check, "
+                 f"{ledger.skipped} backing off after failures, fingerprinting {len(to_check)}")
+
+    def sep_state():
+        return {"results": ip_results, "failed": failed_ips}
+
+    # Collect the results and populate the respective IP lists
+    def on_result(ip, result):
+        record_in_store(store, ip, result, probe(ip))
+        ledger.record(ip, result is not None)
+        if result is not None:
+            ip_results[result.type].append(ip)
+        else:
+            failed_ips.append(ip)
+        if checkpoint.maybe_save(sep_state):
+            store.commit()
+
+    asyncio.run(fingerprint_async(_iterate(to_check), on_result, on_headers=server_recorder(store),
+                                  on_unchecked=failed_ips.append))
+    # A partial run says nothing about the subnets it did not finish
+    if not stop_script:
+        ledger.finish()
+    store.close()
+
+    if stop_script:
+        checkpoint.state = sep_state()
+        checkpoint.save()
+        logging.info("Stopped before completion, run with --resume to continue.")
+        sys.exit(1)
+
+    save_results(ip_results, failed_ips)
+    checkpoint.clear()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fingerprint the alive hosts found by main.py.")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its checkpoint")
+    parser.add_argument("--full", action="store_true",
+                        help="fingerprint every host again instead of only new and changed ones")
+    parser.add_argument("--ttl", type=float, default=FINGERPRINT_TTL / 3600,
+                        help=f"hours a stored classification stays valid (default: {FINGERPRINT_TTL // 3600})")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
+    signal.signal(signal.SIGINT, signal_handler)
+    args = parse_args()
+    main(resume=args.resume, full=args.full, ttl=args.ttl * 3600)
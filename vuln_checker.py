@@ -1,10 +1,24 @@
 import requests
 import sys
 import re
+import time
+from collections import Counter
+
+from hakotx.files import write_atomic
+from hakotx.hoststore import HOST_STORE, HostStore
+from hakotx.ports import OpenPorts
+from hakotx.ranges import ip_to_int
+
+HTTPS_PORT = 443
+VULNERABLE_SERVERS = ("micro_httpd",)
+AUDIT_REPORT = "ips/server_audit.txt"
 
 def is_valid_host(host):
     return re.match(r"^(?:[0-9]{1,3}\.){3}[0-9]{1,3}$", host) or re.match(r"^[a-zA-Z0-9.-]+$", host)
 
+def is_vulnerable(server_info):
+    return server_info.lower() in VULNERABLE_SERVERS
+
 def check_server(ip_or_host, use_https=False):
     scheme = "https" if use_https else "http"
     url = f"{scheme}://{ip_or_host}"
@@ -14,14 +28,54 @@ def check_server(ip_or_host, use_https=False):
         print(f"[+] Connected to {url}")
         print(f"[+] Server header: {server_info}")
 
-        if server_info.lower() == 'micro_httpd':
+        if is_vulnerable(server_info):
             print("[!] Possible vulnerability: Detected micro_httpd server")
         else:
             print("[*] No known vulnerability detected for this server header")
     except requests.exceptions.RequestException as e:
         print(f"[!] Failed to connect to {url}: {e}")
 
+def audit_fleet(store_path=HOST_STORE, report_path=AUDIT_REPORT):
+    """Audits every host sep.py has contacted from the Server headers in the host store, without new requests.
+
+    TLS availability comes from the sweep: it is known when port 443 is
+    among the probed ports (see [sweep] ports in .config.properties).
+    """
+    store = HostStore(store_path)
+    hosts = sorted(store.inventory(), key=lambda host: ip_to_int(host[0]))
+    store.close()
+    if not hosts:
+        print(f"[!] No Server headers recorded in {store_path}, run sep.py first")
+        return
+
+    tls_probed = HTTPS_PORT in OpenPorts().probed
+    servers = Counter(server or "(none)" for _, _, server, _, _ in hosts)
+    lines = [f"# ip type server tls last_seen (tls is '?' when port {HTTPS_PORT} was not probed)"]
+    flagged = []
+    for ip, ip_type, server, open_ports, last_seen in hosts:
+        if tls_probed and open_ports is not None:
+            tls = "yes" if HTTPS_PORT in open_ports else "no"
+        else:
+            tls = "?"
+        seen = time.strftime("%Y-%m-%d", time.localtime(last_seen)) if last_seen else "?"
+        lines.append(f"{ip} {ip_type or 'failed'} {server or '(none)'!r} {tls} {seen}")
+        if is_vulnerable(server):
+            flagged.append(ip)
+
+    write_atomic(report_path, "\n".join(lines) + "\n")
+    print(f"[*] {len(hosts)} hosts audited, report saved to {report_path}")
+    for server, count in servers.most_common():
+        print(f"[*] {count:6d}  {server}")
+    if flagged:
+        print(f"[!] Possible vulnerability: {len(flagged)} hosts run {', '.join(VULNERABLE_SERVERS)}")
+    else:
+        print("[*] No known vulnerability detected in the fleet")
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--fleet":
+        audit_fleet()
+        sys.exit(0)
+
     if len(sys.argv) > 1:
         ip = sys.argv[1]
     else: